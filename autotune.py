@@ -0,0 +1,276 @@
+__author__ = 'Wade Pentz'
+
+import os
+import math
+import argparse
+from config import config
+from client import BYTES_PER_MEGABYTE, preallocate_file, write_at
+from timing import monotonic, percentile
+from logs import client_log
+
+"""autotune.py
+
+The Autotuner searches for the chunk size and file size (and optionally the write engine)
+that give the best file write throughput on the device holding ./client_files, replacing
+manual sweeps with client.py.
+
+The search starts with a coarse grid of chunk and file sizes that double from
+config["chunk_size_minimum"] up to the given maximums. Every candidate is measured a
+minimum number of times and then candidates are raced: a candidate stops being measured
+as soon as the upper bound of its 95% confidence interval on throughput falls below the
+lower bound of the current best. A finer grid around the winner is then raced the same
+way. Confidence intervals use Student's t critical values since candidates are compared
+after only a few trials. All trials write from a single buffer that is allocated once, so
+buffer setup is never part of a measurement.
+
+Trials write files the same way FileWriterClient does, so the optimal throughput can be
+compared with the write rates clients report to the server. Setting "autotune_fsync" in
+config.py adds an fsync to every trial to measure throughput to the device rather than to
+the page cache; those numbers are not comparable with client write rates, which never
+fsync.
+
+Engines:
+    append - each trial writes a new file through a buffered file object, like FileWriterClient's default
+             rollover mode.
+    ring   - each trial overwrites a preallocated file in place, like FileWriterClient's ring mode.
+
+Example usage is shown in the "if __name__ == '__main__':" block at the end of this file.
+    ex: python autotune.py --max-chunk 80 --max-file 200 --engines append ring
+"""
+
+Z_95 = 1.96
+# Two-sided 95% Student's t critical values for 1-30 degrees of freedom. Z_95 is used beyond the table.
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+ENGINES = ('append', 'ring')
+
+
+class Candidate(object):
+    """Measurements for one engine/chunk size/file size combination.
+
+    Args:
+        engine (str): write engine, one of ENGINES.
+        chunk_size (int): size (in megabytes) of each write.
+        file_size (int): size (in megabytes) of each file.
+    """
+
+    def __init__(self, engine, chunk_size, file_size):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.file_size = file_size
+        self.throughputs = []
+        self.latencies = []
+
+    def mean(self):
+        return sum(self.throughputs) / len(self.throughputs)
+
+    def interval(self):
+        """Returns the 95% confidence interval (low, high) of the mean throughput in MB/s."""
+        n = len(self.throughputs)
+        if n < 2:
+            return float('-inf'), float('inf')
+        mean = self.mean()
+        variance = sum((x - mean) ** 2 for x in self.throughputs) / (n - 1)
+        half_width = t_critical(n - 1) * math.sqrt(variance / n)
+        return mean - half_width, mean + half_width
+
+    def __repr__(self):
+        return 'engine={} chunk_size={} MB file_size={} MB'.format(self.engine, self.chunk_size, self.file_size)
+
+
+class Autotuner(object):
+    """Searches the chunk size x file size x engine space for the highest write throughput.
+
+    Args:
+        max_chunk_size (int): largest chunk size (in megabytes) to try.
+        min_file_size (int): smallest file size (in megabytes) to try.
+        max_file_size (int): largest file size (in megabytes) to try.
+        engines (list): write engines to try.
+        min_trials (int): number of trials (at least 2) every candidate gets before it can be eliminated.
+        max_trials (int): maximum number of trials for any candidate.
+    """
+
+    def __init__(self, max_chunk_size, min_file_size, max_file_size, engines=('append',),
+                 min_trials=config["autotune_min_trials"], max_trials=config["autotune_max_trials"]):
+        self.max_chunk_size = max_chunk_size
+        self.min_file_size = max(min_file_size, config["chunk_size_minimum"])
+        self.max_file_size = max_file_size
+        self.engines = engines
+        self.min_trials = max(min_trials, 2)
+        self.max_trials = max(max_trials, self.min_trials)
+        self.candidates = {}
+        self.ring_fds = {}
+        if self.max_chunk_size < config["chunk_size_minimum"]:
+            raise ValueError('Maximum chunk size is below minimum of {} MB'.format(config["chunk_size_minimum"]))
+        for engine in self.engines:
+            if engine not in ENGINES:
+                raise ValueError('Unknown engine: {}'.format(engine))
+        # One buffer for every trial. Smaller chunks are written from slices of it.
+        self.buffer = memoryview(b'\x5a' * self.max_chunk_size * BYTES_PER_MEGABYTE)
+        try:
+            os.makedirs(config["client_file_path"])
+        except OSError:
+            if not os.path.isdir(config["client_file_path"]):
+                raise
+
+    def tune(self):
+        """Runs the coarse and refined searches. Returns the best Candidate."""
+        coarse_grid = self.coarse_grid()
+        if not coarse_grid:
+            raise ValueError('No chunk size and file size combinations to try')
+        try:
+            best = self.race(coarse_grid)
+            client_log.info('Best coarse setting: {} ({:.2f} MB/s)'.format(best, best.mean()))
+            best = self.race(self.refined_grid(best))
+        finally:
+            self.cleanup()
+        low, high = best.interval()
+        client_log.info('Optimal settings: {}'.format(best))
+        client_log.info('    Throughput:    {:.2f} MB/s (95% CI {:.2f} - {:.2f}, {} trials)'.format(
+            best.mean(), low, high, len(best.throughputs)))
+        client_log.info('    Write latency: p50 {:.2f} / p99 {:.2f} ms per chunk'.format(
+            percentile(best.latencies, 50) * 1000, percentile(best.latencies, 99) * 1000))
+        return best
+
+    def candidate(self, engine, chunk_size, file_size):
+        """Returns the Candidate for a combination, reusing earlier measurements if it was already tried."""
+        key = (engine, chunk_size, file_size)
+        if key not in self.candidates:
+            self.candidates[key] = Candidate(engine, chunk_size, file_size)
+        return self.candidates[key]
+
+    def grid(self, engines, chunk_sizes, file_sizes):
+        return [self.candidate(engine, chunk_size, file_size) for engine in engines
+                for chunk_size in sorted(chunk_sizes) for file_size in sorted(file_sizes)
+                if chunk_size <= file_size]
+
+    def coarse_grid(self):
+        """Returns candidates for chunk and file sizes that double from the minimum chunk size."""
+        return self.grid(self.engines, doubling(config["chunk_size_minimum"], self.max_chunk_size),
+                         doubling(self.min_file_size, self.max_file_size))
+
+    def refined_grid(self, best):
+        """Returns candidates halfway (geometrically) between the best coarse candidate and its grid neighbours."""
+        chunk_sizes = set(size for size in steps_around(best.chunk_size)
+                          if config["chunk_size_minimum"] <= size <= self.max_chunk_size)
+        file_sizes = set(size for size in steps_around(best.file_size)
+                         if self.min_file_size <= size <= self.max_file_size)
+        return self.grid([best.engine], chunk_sizes, file_sizes)
+
+    def race(self, candidates):
+        """Measures candidates until the best one's confidence interval separates from all others or every remaining
+        candidate has had max_trials trials. Returns the candidate with the highest mean throughput."""
+        for candidate in candidates:
+            while len(candidate.throughputs) < self.min_trials:
+                self.run_trial(candidate)
+        contenders = list(candidates)
+        while True:
+            best = max(contenders, key=lambda candidate: candidate.mean())
+            best_low = best.interval()[0]
+            contenders = [candidate for candidate in contenders
+                          if candidate is best or candidate.interval()[1] >= best_low]
+            undecided = [candidate for candidate in contenders if len(candidate.throughputs) < self.max_trials]
+            if len(contenders) == 1 or not undecided:
+                return best
+            for candidate in undecided:
+                self.run_trial(candidate)
+
+    def run_trial(self, candidate):
+        """Writes one file with the candidate's settings and records its throughput and per-chunk latencies."""
+        chunk_bytes = candidate.chunk_size * BYTES_PER_MEGABYTE
+        file_bytes = candidate.file_size * BYTES_PER_MEGABYTE
+        f = None
+        if candidate.engine == 'append':
+            f = open(self.trial_file_name(candidate), 'wb')
+        else:
+            fd = self.ring_file(candidate)
+        try:
+            start_time = monotonic()
+            offset = 0
+            while offset < file_bytes:
+                chunk = self.buffer[:min(chunk_bytes, file_bytes - offset)]
+                chunk_start_time = monotonic()
+                if f:
+                    f.write(chunk)
+                else:
+                    write_at(fd, chunk, offset)
+                offset += len(chunk)
+                candidate.latencies.append(monotonic() - chunk_start_time)
+            if config["autotune_fsync"]:
+                if f:
+                    f.flush()
+                os.fsync(f.fileno() if f else fd)
+            write_time = monotonic() - start_time
+        finally:
+            if f:
+                f.close()
+        candidate.throughputs.append(candidate.file_size / write_time)
+        client_log.info('Trial {}: {:.2f} MB/s'.format(candidate, candidate.throughputs[-1]))
+
+    def trial_file_name(self, candidate):
+        return config["client_file_path"] + 'autotune_' + candidate.engine + '_' + str(candidate.file_size)
+
+    def ring_file(self, candidate):
+        """Returns a file descriptor to overwrite for a ring trial. Ring files are preallocated once per file size
+        and kept open."""
+        if candidate.file_size not in self.ring_fds:
+            fd = os.open(self.trial_file_name(candidate), os.O_WRONLY | os.O_CREAT)
+            preallocate_file(fd, candidate.file_size * BYTES_PER_MEGABYTE)
+            os.fsync(fd)
+            self.ring_fds[candidate.file_size] = fd
+        return self.ring_fds[candidate.file_size]
+
+    def cleanup(self):
+        """Closes ring files and removes all trial files."""
+        for fd in self.ring_fds.values():
+            os.close(fd)
+        self.ring_fds = {}
+        for file_name in os.listdir(config["client_file_path"]):
+            if file_name.startswith('autotune_'):
+                os.remove(config["client_file_path"] + file_name)
+
+
+def t_critical(degrees_of_freedom):
+    """Returns the two-sided 95% Student's t critical value for the given degrees of freedom."""
+    if degrees_of_freedom <= len(T_95):
+        return T_95[degrees_of_freedom - 1]
+    return Z_95
+
+
+def doubling(start, stop):
+    """Returns [start, 2*start, 4*start, ...] up to and including stop."""
+    sizes = []
+    size = start
+    while size <= stop:
+        sizes.append(size)
+        size *= 2
+    return sizes
+
+
+def steps_around(size):
+    """Returns size and its geometric midpoints towards size/2 and size*2, rounded to whole megabytes."""
+    return [int(round(size / math.sqrt(2))), size, int(round(size * math.sqrt(2)))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-chunk', dest='max_chunk_size', default=config["autotune_max_chunk_size"], type=int,
+                        help='largest chunk size (MB) to try')
+    parser.add_argument('--min-file', dest='min_file_size', default=config["autotune_min_file_size"], type=int,
+                        help='smallest file size (MB) to try')
+    parser.add_argument('--max-file', dest='max_file_size', default=config["autotune_max_file_size"], type=int,
+                        help='largest file size (MB) to try')
+    parser.add_argument('--engines', dest='engines', nargs='+', default=['append'], choices=ENGINES,
+                        help='write engines to try')
+    parser.add_argument('--min-trials', dest='min_trials', default=config["autotune_min_trials"], type=int,
+                        help='trials per candidate before it can be eliminated')
+    parser.add_argument('--max-trials', dest='max_trials', default=config["autotune_max_trials"], type=int,
+                        help='maximum trials per candidate')
+    args = parser.parse_args()
+
+    try:
+        Autotuner(args.max_chunk_size, args.min_file_size, args.max_file_size, args.engines,
+                  args.min_trials, args.max_trials).tune()
+    except KeyboardInterrupt:
+        client_log.info('Keyboard interrupt: Stopping autotune...')
@@ -0,0 +1,192 @@
+__author__ = 'Wade Pentz'
+
+import os
+import json
+import random
+from config import config
+from client_table import STATUSES
+from report import as_list
+from timing import percentile
+
+"""baseline.py
+
+Run-to-run performance regression detection. At the end of a run the server can save
+the metrics of every client that passed as a named baseline, grouped by client
+configuration (chunk size, file size, and file ring size). A later run can be compared
+against a saved baseline: for every configuration present in both runs, statistics such
+as the median write rate and the 95th percentile file write time are compared using
+bootstrap confidence intervals on their relative change. A change is flagged as a
+regression or improvement when its confidence interval excludes zero and it is larger
+than config["baseline_min_change"].
+
+Each client contributes one sample per metric, so a configuration needs at least
+config["baseline_min_samples"] passing clients in both runs to be compared. Resampling
+uses a fixed seed so that the same two runs always give the same verdict.
+
+gate_status() turns a comparison into an exit status for use as a performance gate. A
+comparison where no statistic reached a verdict (no configuration in common with the
+baseline, or too few passing clients) fails the gate with its own status rather than
+passing it.
+"""
+
+# Per-client metrics stored in a baseline
+BASELINE_METRICS = ('write_rate', 'file_write_time', 'rtt_p50', 'rtt_p99')
+# Statistics compared between runs: (metric, percentile across clients, True if higher values are better)
+COMPARISONS = (
+    ('write_rate', 50, True),
+    ('file_write_time', 50, False),
+    ('file_write_time', 95, False),
+    ('rtt_p99', 50, False),
+)
+BOOTSTRAP_SEED = 0
+# Exit statuses of a performance gate
+GATE_PASS = 0
+GATE_REGRESSION = 1
+GATE_NO_VERDICT = 2
+
+
+def config_key(chunk_size, file_size, ring_size):
+    return 'chunk_size={}:file_size={}:ring_size={}'.format(chunk_size, file_size, ring_size)
+
+
+def build_baseline(table):
+    """Groups the metrics of every client that passed by client configuration.
+    Returns {configuration key: {metric: [one sample per client]}}."""
+    baseline = {}
+    passed = STATUSES.index('PASS')
+    keys = [config_key(*settings) for settings in zip(as_list(table.column('chunk_size')),
+                                                      as_list(table.column('file_size')),
+                                                      as_list(table.column('ring_size')))]
+    metrics = [as_list(table.metric(name)) for name in BASELINE_METRICS]
+    for row, status in enumerate(as_list(table.column('status'))):
+        if status == passed:
+            samples = baseline.setdefault(keys[row], dict((name, []) for name in BASELINE_METRICS))
+            for name, values in zip(BASELINE_METRICS, metrics):
+                samples[name].append(values[row])
+    return baseline
+
+
+def baseline_file(name):
+    return config["baseline_path"] + name + '.json'
+
+
+def save_baseline(baseline, name):
+    """Saves a baseline under the given name. Returns the path of the baseline file."""
+    try:
+        os.makedirs(config["baseline_path"])
+    except OSError:
+        if not os.path.isdir(config["baseline_path"]):
+            raise
+    with open(baseline_file(name), 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    return baseline_file(name)
+
+
+def load_baseline(name):
+    """Loads a saved baseline. Raises IOError if it does not exist and ValueError if it is not a valid baseline."""
+    with open(baseline_file(name)) as f:
+        baseline = json.load(f)
+    if not isinstance(baseline, dict) or not all(
+            isinstance(samples, dict) and all(isinstance(samples.get(metric), list) for metric in BASELINE_METRICS)
+            for samples in baseline.values()):
+        raise ValueError('{} is not a valid baseline'.format(baseline_file(name)))
+    return baseline
+
+
+def relative_change(baseline_samples, current_samples, pct):
+    """Returns the relative change of the pct percentile from the baseline to the current samples,
+    or None if the baseline percentile is zero."""
+    baseline_value = percentile(baseline_samples, pct)
+    if not baseline_value:
+        return None
+    return (percentile(current_samples, pct) - baseline_value) / float(baseline_value)
+
+
+def bootstrap_interval(baseline_samples, current_samples, pct, rng):
+    """Returns the confidence interval (low, high) of relative_change() from resampling both sets of samples,
+    or None if no resample had a non-zero baseline."""
+    changes = []
+    for resample in range(config["baseline_resamples"]):
+        change = relative_change([rng.choice(baseline_samples) for sample in baseline_samples],
+                                 [rng.choice(current_samples) for sample in current_samples], pct)
+        if change is not None:
+            changes.append(change)
+    if not changes:
+        return None
+    tail = (1 - config["baseline_confidence"]) / 2 * 100
+    return percentile(changes, tail), percentile(changes, 100 - tail)
+
+
+class Comparison(object):
+    """Result of comparing one statistic of one client configuration between a baseline and the current run.
+
+    Args:
+        key (str): client configuration key.
+        metric (str): per-client metric that was compared.
+        pct (int): percentile of the metric across clients that was compared.
+        higher_is_better (bool): True if an increase in the statistic is an improvement.
+        baseline_samples (list): per-client samples from the baseline.
+        current_samples (list): per-client samples from the current run.
+        rng (random.Random): random number generator used for resampling.
+    """
+
+    def __init__(self, key, metric, pct, higher_is_better, baseline_samples, current_samples, rng):
+        self.key = key
+        self.metric = metric
+        self.pct = pct
+        self.baseline_value = percentile(baseline_samples, pct)
+        self.current_value = percentile(current_samples, pct)
+        self.change = None
+        self.interval = None
+        if min(len(baseline_samples), len(current_samples)) >= config["baseline_min_samples"]:
+            self.change = relative_change(baseline_samples, current_samples, pct)
+            self.interval = bootstrap_interval(baseline_samples, current_samples, pct, rng)
+        if self.change is None or self.interval is None:
+            self.verdict = 'INSUFFICIENT DATA'
+        elif (self.interval[0] <= 0 <= self.interval[1]) or abs(self.change) < config["baseline_min_change"]:
+            self.verdict = 'NO CHANGE'
+        elif (self.change > 0) == higher_is_better:
+            self.verdict = 'IMPROVEMENT'
+        else:
+            self.verdict = 'REGRESSION'
+
+
+def compare(baseline, current):
+    """Compares every configuration present in both runs. Returns a list of Comparisons."""
+    rng = random.Random(BOOTSTRAP_SEED)
+    comparisons = []
+    for key in sorted(set(baseline) & set(current)):
+        for metric, pct, higher_is_better in COMPARISONS:
+            comparisons.append(Comparison(key, metric, pct, higher_is_better,
+                                          baseline[key][metric], current[key][metric], rng))
+    return comparisons
+
+
+def gate_status(comparisons):
+    """Returns GATE_REGRESSION if any statistic regressed, GATE_NO_VERDICT if no statistic could be compared,
+    and GATE_PASS otherwise."""
+    verdicts = set(comparison.verdict for comparison in comparisons)
+    if 'REGRESSION' in verdicts:
+        return GATE_REGRESSION
+    if not verdicts - set(['INSUFFICIENT DATA']):
+        return GATE_NO_VERDICT
+    return GATE_PASS
+
+
+def log_comparisons(log, name, comparisons):
+    """Writes the result of a baseline comparison to a logger. Returns the number of regressions."""
+    log.info('Comparison against baseline "{}":'.format(name))
+    if not comparisons:
+        log.info('    No client configurations in common with the baseline')
+    for comparison in comparisons:
+        line = '    {:<17} {} {} p{}: {:.4f} -> {:.4f}'.format(comparison.verdict, comparison.key, comparison.metric,
+                                                            comparison.pct, comparison.baseline_value,
+                                                            comparison.current_value)
+        if comparison.interval is not None:
+            line += ' ({:+.1f}%, CI {:+.1f}% to {:+.1f}%)'.format(
+                comparison.change * 100, comparison.interval[0] * 100, comparison.interval[1] * 100)
+        log.info(line)
+    regressions = len([comparison for comparison in comparisons if comparison.verdict == 'REGRESSION'])
+    log.info('    {} regression(s), {} improvement(s)'.format(
+        regressions, len([comparison for comparison in comparisons if comparison.verdict == 'IMPROVEMENT'])))
+    return regressions
@@ -0,0 +1,124 @@
+__author__ = 'Wade Pentz'
+
+import os
+import sys
+import socket
+import select
+import argparse
+import subprocess
+from config import config
+from client_api import client_api
+from timing import monotonic, percentile
+from logs import client_log
+
+"""bench_startup.py
+
+Measures how long FileWriterClients take to start: the time from launching a client
+process to a 'ready' message arriving at the server's address. A minimal listening
+socket stands in for the server. It records when each client's 'ready' arrives and then
+closes the connection, which shuts the client down before it runs any tests, so only
+startup is measured. The server must not be running while the benchmark runs.
+
+Clients are launched one at a time, or all at once with --concurrent to measure how long
+a campaign takes to bring up many clients.
+
+Example usage is shown in the "if __name__ == '__main__':" block at the end of this file.
+    ex: python bench_startup.py -n 20 --concurrent -c 10 -f 50
+"""
+
+CLIENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'client.py')
+RECV_SIZE = 4096
+
+
+def launch_batch(listener, count, client_args, timeout):
+    """Launches count clients at once. Returns the time (in seconds) from launch until each client's 'ready'
+    arrived, in order of arrival."""
+    ready_msg = client_api["ready"] + client_api["terminator"]
+    devnull = open(os.devnull, 'w')
+    start_time = monotonic()
+    processes = [subprocess.Popen([sys.executable, CLIENT_SCRIPT] + list(client_args), stdout=devnull,
+                                  stderr=devnull) for i in range(count)]
+    buffers = {}
+    startup_times = []
+    try:
+        while len(startup_times) < count:
+            remaining = timeout - (monotonic() - start_time)
+            if remaining <= 0:
+                raise RuntimeError('Only {} of {} clients were ready within {} sec'.format(
+                    len(startup_times), count, timeout))
+            readable, unused, unused = select.select([listener] + list(buffers), [], [],
+                                                     min(remaining, config["done_check_period"]))
+            if not readable and all(process.poll() is not None for process in processes):
+                raise RuntimeError('{} of {} clients exited without sending ready'.format(
+                    count - len(startup_times), count))
+            for sock in readable:
+                if sock is listener:
+                    conn, addr = listener.accept()
+                    buffers[conn] = ''
+                    continue
+                data = sock.recv(RECV_SIZE)
+                buffers[sock] += data
+                if ready_msg in buffers[sock] or not data:
+                    if data:
+                        startup_times.append(monotonic() - start_time)
+                    del buffers[sock]
+                    sock.close()
+    except Exception:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        raise
+    finally:
+        for sock in buffers:
+            sock.close()
+        for process in processes:
+            process.wait()
+        devnull.close()
+    return startup_times
+
+
+def measure_startup(launches, concurrent=False, client_args=(), timeout=30):
+    """Launches clients against a listening socket on the configured host and port.
+
+    Args:
+        launches (int): number of clients to launch.
+        concurrent (bool): launch every client at once instead of one at a time.
+        client_args (list): command line arguments passed to client.py.
+        timeout (float): seconds to wait for the clients of one launch to be ready.
+
+    Returns the startup time (in seconds) of every client."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        listener.bind((config["host"], config["port"]))
+        listener.listen(config["listen_backlog"])
+        if concurrent:
+            return launch_batch(listener, launches, client_args, timeout)
+        startup_times = []
+        for launch in range(launches):
+            startup_times.extend(launch_batch(listener, 1, client_args, timeout))
+        return startup_times
+    finally:
+        listener.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--launches', dest='launches', default=10, type=int,
+                        help='number of clients to launch')
+    parser.add_argument('--concurrent', dest='concurrent', action='store_true',
+                        help='launch every client at once instead of one at a time')
+    parser.add_argument('-c', '--chunksize', dest='chunk_size', default=config["default_chunk_size"], type=int,
+                        help='chunk size passed to each client')
+    parser.add_argument('-f', '--filesize', dest='file_size', default=config["default_file_size"], type=int,
+                        help='file size passed to each client')
+    parser.add_argument('-k', '--ringsize', dest='ring_size', default=config["file_ring_size"], type=int,
+                        help='file ring size passed to each client')
+    args = parser.parse_args()
+
+    client_args = ['-c', str(args.chunk_size), '-f', str(args.file_size), '-k', str(args.ring_size)]
+    startup_times = measure_startup(args.launches, args.concurrent, client_args)
+    client_log.info('Client startup (launch to ready) over {} {} launch(es):'.format(
+        len(startup_times), 'concurrent' if args.concurrent else 'sequential'))
+    client_log.info('    p50 {:.1f} / p95 {:.1f} / max {:.1f} ms'.format(
+        percentile(startup_times, 50) * 1000, percentile(startup_times, 95) * 1000, max(startup_times) * 1000))
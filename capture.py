@@ -0,0 +1,47 @@
+__author__ = 'Wade Pentz'
+
+import struct
+from timing import monotonic
+
+"""capture.py
+
+MessageCapture records every message the server receives from its clients into a compact
+binary capture file so that the session can later be replayed against a server with
+replay.py. Each record is a fixed-size header followed by the raw message:
+
+    seconds since capture start (double) | client id (uint32) | message length (uint16) | message
+
+read_capture() yields the records of a capture file back in the order they were written.
+"""
+
+RECORD_HEADER = struct.Struct('!dIH')
+
+
+class MessageCapture(object):
+    """Writes inbound client messages with their arrival time and client id to a capture file.
+
+    Args:
+        file_name (str): path of the capture file to create.
+    """
+
+    def __init__(self, file_name):
+        self.file = open(file_name, 'wb')
+        self.start_time = monotonic()
+
+    def record(self, client_id, msg):
+        """Appends a single message received from client_id to the capture file."""
+        self.file.write(RECORD_HEADER.pack(monotonic() - self.start_time, int(client_id), len(msg)) + msg)
+
+    def close(self):
+        self.file.close()
+
+
+def read_capture(file_name):
+    """Generator that yields (timestamp, client_id, msg) for every record in a capture file."""
+    with open(file_name, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, client_id, length = RECORD_HEADER.unpack(header)
+            yield timestamp, client_id, f.read(length)
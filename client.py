@@ -5,12 +5,13 @@ import asynchat
 import socket
 import os
 import time
+import errno
+import ctypes
 import logging
-import argparse
 from sys import platform
-from multiprocessing import Process
 from config import config
 from client_api import client_api
+from timing import monotonic, percentile
 from logs import client_log, file_formatter
 
 """client.py
@@ -29,19 +30,47 @@ The method run_tests() must be extended in inheriting client classes. Once the c
 is set up it sends a 'ready' message to the server. Then tests are kicked off when the 
 server sends a 'start' message (run_tests() is called).
 
+Report messages sent to the server carry the client's monotonic timestamp as their last
+argument so that the server can measure run time on the client's clock and detect when its
+own processing delays messages. Heartbeats are echoed back by the server and the client
+tracks the round-trip times, reporting their percentiles to the server before it finishes.
+
+If the shared-memory transport is enabled in config.py and the server runs on the same
+host, the client asks to attach to the server's shared stats table once it receives its
+client id (see shm_transport.py). Once the server accepts, performance stats and file
+rollovers are published into shared memory instead of being sent over the socket. If the
+server rejects the request (ex: the table file is stale or the server runs on another host)
+the client keeps sending them over TCP. A test request that arrives before the server has
+replied is held until it does, so a run never mixes the two transports.
+
 2. FileWriterClient is an example of a test client that inherits the Client class. 
 The client writes files as defined by the input parameters chunk_size and file_size
 Once the client has run for the time designated by the run_time input parameter it
 closes itself. chunk_size and file_size are in units of megabytes while run_time is 
 in seconds. Checks are performed at initialization to verify that the given chunk_size
-is not less than 10 MB and that the given parameters will allow the client to write
-at least 2 files before closing. Files are written into ./client_files.
+is not less than 10 MB, and right after the client reports ready to verify that the given
+parameters will allow the client to write at least 2 files before closing (otherwise the
+client closes without running, before the server admits it). Files are written into
+./client_files.
+
+By default every file rollover creates a new file. When ring_size is set the client instead
+preallocates a fixed ring of that many files and overwrites them in place, which keeps disk
+usage bounded. The ring is preallocated before the test starts, so allocation does not count
+towards run_time, and the time it takes is reported to the server separately from the time
+spent writing each file. The ring files are removed when the client closes.
 
 The file write process is benchmarked and the CPU and memory usage of the process
-are reported to the server every 10 seconds. A heartbeat is also sent to the server
-every 5 seconds. Each of these three activities is given its own thread that is 
-managed by the standard Python multithreading library (Process class). All threads
-are terminated when the client shuts down.
+are reported to the server every 10 seconds. A heartbeat (echoed by the server to measure
+round-trip time) is also sent to the server every 5 seconds. Each of these three activities
+is given its own thread that is managed by the standard Python multithreading library
+(Process class). All threads are terminated when the client shuts down.
+
+Client startup is kept short so that hundreds of clients can be launched at once. Nothing
+touches the disk before 'ready' is sent: the log directory and log file are created right
+after it, and the file directory, file rollover check, and file write buffers are only set
+up once the server sends the test request. multiprocessing, argparse and the shared-memory
+transport are only imported where they are used. bench_startup.py measures the time from
+launching a client process to the server receiving its 'ready' message.
 
 Example usage of this class is shown in the "if __name__ == '__main__':" block at
 the end of this file.
@@ -55,6 +84,58 @@ COLUMN_PID = 1
 COLUMN_CPU = 2
 COLUMN_MEM = 3
 
+
+def load_posix_fallocate():
+    """Returns the C library's posix_fallocate() function (64-bit offsets), or None if it cannot be found."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+    for name in ('posix_fallocate64', 'posix_fallocate'):
+        try:
+            fallocate = getattr(libc, name)
+        except AttributeError:
+            continue
+        fallocate.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        return fallocate
+    return None
+
+# Python 2 has no os.posix_fallocate, so call the C library directly through ctypes (as timing.py does
+# for clock_gettime).
+_posix_fallocate = None if hasattr(os, 'posix_fallocate') else load_posix_fallocate()
+
+
+def preallocate_file(fd, size):
+    """Reserves size bytes of disk space for the file open on fd."""
+    if hasattr(os, 'posix_fallocate'):
+        os.posix_fallocate(fd, 0, size)
+        return
+    if _posix_fallocate is not None:
+        error = _posix_fallocate(fd, 0, size)
+        if not error:
+            return
+        if error not in (errno.EOPNOTSUPP, errno.EINVAL):
+            raise OSError(error, os.strerror(error))
+    # No fallocate available (or not supported by the filesystem), so write zeros the way glibc does
+    # on filesystems without native fallocate support.
+    zeros = b'\x00' * min(size, BYTES_PER_MEGABYTE)
+    offset = 0
+    while offset < size:
+        offset += write_at(fd, zeros[:size - offset], offset)
+
+
+def write_at(fd, data, offset):
+    """Writes all of data to the file open on fd starting at offset. Returns the number of bytes written."""
+    view = memoryview(data)
+    written = 0
+    while written < len(view):
+        if hasattr(os, 'pwrite'):
+            written += os.pwrite(fd, view[written:], offset + written)
+        else:
+            os.lseek(fd, offset + written, os.SEEK_SET)
+            written += os.write(fd, view[written:])
+    return written
+
 class Client(asynchat.async_chat):
     """A generic client class that handles connecting to the server including sending/receiving basic messages
     to/from the server. Designed to be inherited to create clients that run specific tests while reporting to the server.
@@ -75,17 +156,27 @@ class Client(asynchat.async_chat):
         self.host = host
         self.port = port
         self.client_id = 0
+        self.shared_stats = None
+        self.shm_slot = None
+        self.pending_shared_stats = None
+        self.pending_shm_slot = None
+        self.run_requested = False
+        self.rtt_samples = []
         self.msg_buffer = []
         self.msg = ''
         self.msg_split = []
         self.set_terminator(client_api["terminator"])
-        self.init_log_file()
         self.msg_handler = { client_api["set_client_id"]: self.handle_set_id,
-                             client_api["run_tests"]: self.handle_run_tests } 
+                             client_api["run_tests"]: self.handle_run_tests,
+                             client_api["heartbeat_ack"]: self.handle_heartbeat_ack,
+                             client_api["shm_attach_ack"]: self.handle_shm_attach_ack,
+                             client_api["shm_attach_nack"]: self.handle_shm_attach_nack } 
     
     def connect_to_server(self):
         # Connect to server
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Send small protocol messages immediately so their timestamps are not skewed by Nagle's algorithm
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.connect((self.host, self.port))
         asyncore.loop(timeout=config["client_timeout"])
 
@@ -96,16 +187,18 @@ class Client(asynchat.async_chat):
         except OSError as e:
             if not os.path.isdir(config["client_log_path"]):
                 raise e
-        client_log_file = logging.FileHandler(config["client_log_path"] + 'client_log_' + 
+        client_log_file = logging.FileHandler(config["client_log_path"] + 'client_log_' +
                                                 time.strftime('%Y-%m-%d_%H.%M.%S') + '.txt')
         client_log_file.setLevel(logging.DEBUG)
         client_log_file.setFormatter(file_formatter)
         client_log.addHandler(client_log_file)
 
     def handle_connect(self):
-        client_log.info('Connected to server')
         self.send_get_id()
         self.send_ready()
+        # The log file is only set up once 'ready' is on its way so that it does not delay startup
+        self.init_log_file()
+        client_log.info('Connected to server')
 
     def handle_close(self):
         if self.client_id:
@@ -118,10 +211,13 @@ class Client(asynchat.async_chat):
         self.msg_buffer.append(data)
 
     def found_terminator(self):
-        """Processes the incoming message by looking up the handler in the message dictionary."""
+        """Processes the incoming message by looking up the handler in the message dictionary.
+        The message buffer is cleared before the handler runs because a handler may service the socket itself
+        (ex: FileWriterClient.run_tests), and messages received meanwhile must start from an empty buffer."""
         self.msg = ''.join(self.msg_buffer)
+        self.msg_buffer = []
         self.msg_split = self.msg.split(client_api["delimiter"])
-        cmd = self.msg.split(client_api["delimiter"])[0]
+        cmd = self.msg_split[0]
         try:
             self.msg_handler[cmd]()
         except KeyError as e:
@@ -130,7 +226,6 @@ class Client(asynchat.async_chat):
             client_log.info('Exception raised in client when running found_terminator: {}'.format(repr(e)))
             raise e
         finally:
-            self.msg_buffer = []
             self.msg = ''
             self.msg_split = []
 
@@ -138,6 +233,10 @@ class Client(asynchat.async_chat):
         """Runs desired client tests. This method must be overridden in any child class."""
         raise NotImplementedError
 
+    def timestamp(self):
+        """Returns the client's monotonic clock formatted as a trailing message argument."""
+        return client_api["delimiter"] + repr(monotonic())
+
     ## MESSAGE SENDERS:
 
     def send_get_id(self):
@@ -150,11 +249,55 @@ class Client(asynchat.async_chat):
 
     def send_start(self):
         """Informs the server that the client has started running the test request."""
-        self.push(client_api["start"] + client_api["terminator"])
+        self.push(client_api["start"] + self.timestamp() + client_api["terminator"])
 
     def send_done(self):
         """Informs the server that the client is done running."""
-        self.push(client_api["done"] + client_api["terminator"])
+        self.push(client_api["done"] + self.timestamp() + client_api["terminator"])
+
+    def send_heartbeat_request(self):
+        """Sends a heartbeat carrying the client's monotonic send time. The server echoes it back."""
+        self.push(client_api["heartbeat"] + self.timestamp() + client_api["terminator"])
+
+    def send_rtt_stats(self):
+        """Sends the number of heartbeat round trips and their 50th/95th/99th percentile and maximum (in seconds)."""
+        self.push(client_api["send_rtt_stats"] + client_api["delimiter"] + str(len(self.rtt_samples)) +
+            ''.join(client_api["delimiter"] + repr(percentile(self.rtt_samples, pct)) for pct in (50, 95, 99, 100)) +
+            self.timestamp() + client_api["terminator"])
+
+    def send_shm_attach(self, slot, table):
+        """Asks the server to accept telemetry published to the given slot of the shared stats table. The device and
+        inode of the table file are included so the server can check that it is the table it created."""
+        device, inode = table.identity()
+        self.push(client_api["shm_attach"] + client_api["delimiter"] + str(slot) + client_api["delimiter"] +
+            str(device) + client_api["delimiter"] + str(inode) + client_api["terminator"])
+
+    def attach_shared_stats(self):
+        """Requests to attach to the server's shared stats table if the shared-memory transport is enabled.
+        Telemetry is only published to the table once the server accepts (see handle_shm_attach_ack) and falls
+        back to TCP messages if the table cannot be opened or the server rejects it."""
+        if not config["shm_transport"]:
+            return
+        from shm_transport import SharedStatsTable, slot_for_client
+        slot = slot_for_client(self.client_id, config["shm_slots"])
+        if slot is None:
+            client_log.info('WARNING: No shared memory slot for client id {}. Sending stats over TCP.'.format(
+                self.client_id))
+            return
+        try:
+            self.pending_shared_stats = SharedStatsTable(config["shm_path"], config["shm_slots"])
+        except (EnvironmentError, ValueError):
+            client_log.info('WARNING: Could not attach to shared memory stats table. Sending stats over TCP.')
+            return
+        self.pending_shm_slot = slot
+        client_log.info('Requesting shared memory stats table slot {}'.format(slot))
+        self.send_shm_attach(slot, self.pending_shared_stats)
+
+    def run_requested_tests(self):
+        """Runs a test request that was held while waiting for the server's reply to the shared stats table attach."""
+        if self.run_requested:
+            self.run_requested = False
+            self.run_tests()
 
     ## MESSAGE HANDLERS:
 
@@ -163,6 +306,7 @@ class Client(asynchat.async_chat):
         if len(self.msg_split) == 2:
             self.client_id = self.msg_split[1]
             client_log.info('Client id received from server: {}'.format(self.client_id))
+            self.attach_shared_stats()
         else:
             client_log.info('ERROR: Invalid client id received from server!')
             self.handle_close()
@@ -170,8 +314,44 @@ class Client(asynchat.async_chat):
     def handle_run_tests(self):
         """Begins testing at the server's request."""
         client_log.info('Test run request received from server')
+        if self.pending_shared_stats:
+            client_log.info('Waiting for the server to reply to the shared memory stats table attach request...')
+            self.run_requested = True
+            return
         self.run_tests()
 
+    def handle_shm_attach_ack(self):
+        """Publishes telemetry to the shared stats table now that the server has accepted the attach request."""
+        if not self.pending_shared_stats or len(self.msg_split) != 2 or \
+                int(self.msg_split[1]) != self.pending_shm_slot:
+            client_log.info('WARNING: Invalid shared memory stats table attach acknowledgement received from server')
+            self.handle_shm_attach_nack()
+            return
+        self.shared_stats = self.pending_shared_stats
+        self.shm_slot = self.pending_shm_slot
+        self.pending_shared_stats = None
+        self.pending_shm_slot = None
+        client_log.info('Attached to shared memory stats table in slot {}'.format(self.shm_slot))
+        self.run_requested_tests()
+
+    def handle_shm_attach_nack(self):
+        """Keeps sending telemetry over TCP because the server rejected the attach request."""
+        if self.pending_shared_stats:
+            self.pending_shared_stats.close()
+            self.pending_shared_stats = None
+            self.pending_shm_slot = None
+        client_log.info('WARNING: Server rejected the shared memory stats table. Sending stats over TCP.')
+        self.run_requested_tests()
+
+    def handle_heartbeat_ack(self):
+        """Records the round-trip time of a heartbeat echoed by the server."""
+        if len(self.msg_split) == 2:
+            rtt = monotonic() - float(self.msg_split[1])
+            self.rtt_samples.append(rtt)
+            client_log.info('Heartbeat acknowledged by server (RTT={:.2f} ms)'.format(rtt * 1000))
+        else:
+            client_log.info('WARNING: Invalid heartbeat acknowledgement received from server')
+
 
 class FileWriterClient(Client):
     """Multi-threaded client that writes a file while reporting performance data to the host.
@@ -183,35 +363,42 @@ class FileWriterClient(Client):
         run_time (int): number of seconds that the client should run for
         chunk_size (int): size of data "chunks" (in megabytes) that client should write to files
         file_size (int): size of files (in megabytes) that client should write
+        ring_size (int): number of preallocated files to overwrite in place (0 writes a new file per rollover)
     """
 
     def __init__(self, host, port, run_time=config["default_run_time"], 
-            chunk_size=config["default_chunk_size"], file_size=config["default_file_size"]):
+            chunk_size=config["default_chunk_size"], file_size=config["default_file_size"],
+            ring_size=config["file_ring_size"]):
         Client.__init__(self, host, port)
         self.run_time = run_time
         self.chunk_size = chunk_size
         self.file_size = file_size
-        self.chunk = b'\x5a' * self.chunk_size * BYTES_PER_MEGABYTE
+        self.ring_size = ring_size
         self.chunks_per_file = int(self.file_size / self.chunk_size)
         self.remaining_mb = int(self.file_size % self.chunk_size)
-        self.remaining_chunk = b'\x5a' * self.remaining_mb * BYTES_PER_MEGABYTE
+        # Allocated by allocate_buffers() once 'ready' has been sent
+        self.chunk = None
+        self.remaining_chunk = None
         self.tests_done = False
         self.threads = []
-        try:
-            os.makedirs(config["client_file_path"])
-        except OSError as e:
-            if not os.path.isdir(config["client_file_path"]):
-                client_log.info('ERROR: Could not create nor find client file directory.')
-                self.handle_close()
-                raise e
-        if not self.check_chunk_size() or not self.check_file_rollover():
+        self.ring_fds = []
+        if not self.check_chunk_size() or not self.check_ring_size():
             raise ValueError('Invalid client configuration!')
 
+    def handle_connect(self):
+        Client.handle_connect(self)
+        # Like the log file, the file directory and rollover check are set up once 'ready' is on its way, but before
+        # the server admits the client, so a configuration that cannot run does not take an admission slot
+        if not self.init_file_path() or not self.check_file_rollover():
+            client_log.info('ERROR: Invalid client configuration! Tests not run.')
+            self.handle_close()
+
     def handle_close(self):
         Client.handle_close(self)
         self.tests_done = True
         for thread in self.threads:
             thread.terminate()
+        self.close_ring()
 
     def run_tests(self):
         """Kicks off threads for the following processes: 
@@ -220,11 +407,19 @@ class FileWriterClient(Client):
             - Periodically sending performance stats to the server
 
         These processes are all terminated when client closes."""
+        from multiprocessing import Process
+        self.allocate_buffers()
         self.send_file_stats()
+        if self.ring_size and not self.allocate_ring():
+            self.handle_close()
+            return
         client_log.info('Running tests...')
         self.send_start()
-        test_end_time = time.time() + self.run_time
-        file_write_thread = Process(target=self.write_file)
+        test_end_time = monotonic() + self.run_time
+        if self.ring_size:
+            file_write_thread = Process(target=self.write_file_ring)
+        else:
+            file_write_thread = Process(target=self.write_file)
         file_write_thread.start()
         self.threads.append(file_write_thread)
         heartbeat_thread = Process(target=self.send_heartbeat)
@@ -233,11 +428,29 @@ class FileWriterClient(Client):
         send_stats_thread = Process(target=self.send_performance_stats, args=(file_write_thread.pid,))
         send_stats_thread.start()
         self.threads.append(send_stats_thread)
-        while not self.tests_done and time.time() < test_end_time:
-            time.sleep(config["done_check_period"])
+        while not self.tests_done and monotonic() < test_end_time:
+            # Keep servicing the socket while waiting so heartbeat acknowledgements are timed as they arrive
+            asyncore.loop(timeout=config["done_check_period"], count=1)
+        self.send_rtt_stats()
         self.send_done()
         self.handle_close()
 
+    def init_file_path(self):
+        """Creates the directory files are written to. Returns False if it can be neither created nor found."""
+        try:
+            os.makedirs(config["client_file_path"])
+        except OSError:
+            if not os.path.isdir(config["client_file_path"]):
+                client_log.info('ERROR: Could not create nor find client file directory.')
+                return False
+        return True
+
+    def allocate_buffers(self):
+        """Allocates the chunk buffers written by the file write thread."""
+        if self.chunk is None:
+            self.chunk = b'\x5a' * self.chunk_size * BYTES_PER_MEGABYTE
+            self.remaining_chunk = b'\x5a' * self.remaining_mb * BYTES_PER_MEGABYTE
+
     def check_chunk_size(self):
         """Verifies that the provided chunk_size meets the spec (minimum of 10 MB)"""
         if self.chunk_size < config["chunk_size_minimum"]:
@@ -248,27 +461,37 @@ class FileWriterClient(Client):
             return False
         return True
 
+    def check_ring_size(self):
+        """Verifies that the provided ring_size is not negative."""
+        if self.ring_size < 0:
+            client_log.info('ERROR: File ring size cannot be negative')
+            return False
+        return True
+
     def check_file_rollover(self):
-        """Checks if the file will rollover twice with the given arguments based on a timed performance measurement."""
+        """Checks if the file will rollover twice with the given arguments based on a timed performance measurement.
+        The time to write a file is estimated from the time to write one chunk and the remaining chunk."""
         client_log.info('Checking if files will rollover twice with the given client parameters...')
-        file_name = config["client_file_path"] + 'client_test_file_' + str(time.time())
+        self.allocate_buffers()
+        file_name = config["client_file_path"] + 'client_test_file_' + str(os.getpid()) + '_' + str(time.time())
         try:
             with open(file_name, 'ab') as f:
-                start_time = time.time()
+                start_time = monotonic()
                 f.write(self.chunk)
-                chunk_write_time = time.time() - start_time
-                start_time = time.time()
+                chunk_write_time = monotonic() - start_time
+                start_time = monotonic()
                 f.write(self.remaining_chunk)
-                remaining_chunk_write_time = time.time() - start_time
+                remaining_chunk_write_time = monotonic() - start_time
                 file_roll_time = chunk_write_time * self.chunks_per_file + remaining_chunk_write_time
         except IOError:
             client_log.info('ERROR: Could not open test file to write!')
-            self.handle_close()
+            return False
         except Exception:
             client_log.info('ERROR: Unknown error during test file write!')
-            self.handle_close()
+            return False
         finally:
-            os.remove(file_name)
+            if os.path.exists(file_name):
+                os.remove(file_name)
         # Convert to seconds and check against 2-file-roll requirement
         if file_roll_time * 2 < self.run_time:
             return True
@@ -284,11 +507,13 @@ class FileWriterClient(Client):
                 '_' + time.strftime('%Y-%m-%d_%H.%M.%S') 
             try:
                 with open(file_name, 'ab') as f:
+                    start_time = monotonic()
                     for chunk in range(self.chunks_per_file):
                         f.write(self.chunk)
                     f.write(self.remaining_chunk)
+                    write_time = monotonic() - start_time
                     client_log.info('Finished writing {} MB file! Starting new file write...'.format(self.file_size))
-                    self.send_file_rollover()
+                    self.send_file_rollover(write_time)
             except IOError:
                 client_log.info('ERROR: Could not open file to write!')
                 self.handle_close()
@@ -297,14 +522,72 @@ class FileWriterClient(Client):
                 self.handle_close()
             file_count += 1
 
+    def allocate_ring(self):
+        """Creates and preallocates the ring of files before the test starts, so allocation does not count towards
+        run_time. Files left by an earlier run under the same names are truncated first so that the allocation is
+        always measured in full. The time taken is reported to the server separately from the file write times.
+        Returns False if the ring could not be allocated."""
+        file_bytes = self.file_size * BYTES_PER_MEGABYTE
+        try:
+            start_time = monotonic()
+            for index in range(self.ring_size):
+                self.ring_fds.append(os.open(self.ring_file_name(index), os.O_WRONLY | os.O_CREAT | os.O_TRUNC))
+                preallocate_file(self.ring_fds[-1], file_bytes)
+            alloc_time = monotonic() - start_time
+        except OSError:
+            client_log.info('ERROR: Could not allocate file ring!')
+            return False
+        client_log.info('Preallocated ring of {} x {} MB files in {:.2f} sec'.format(
+            self.ring_size, self.file_size, alloc_time))
+        self.send_file_alloc(alloc_time)
+        return True
+
+    def close_ring(self):
+        """Closes and removes the ring files."""
+        for index, fd in enumerate(self.ring_fds):
+            os.close(fd)
+            try:
+                os.remove(self.ring_file_name(index))
+            except OSError:
+                pass
+        self.ring_fds = []
+
+    def write_file_ring(self):
+        """Thread: Overwrites the preallocated ring files in place, one after another, until the client closes."""
+        try:
+            file_count = 0
+            while not self.tests_done:
+                fd = self.ring_fds[file_count % self.ring_size]
+                start_time = monotonic()
+                offset = 0
+                for chunk in range(self.chunks_per_file):
+                    offset += write_at(fd, self.chunk, offset)
+                write_at(fd, self.remaining_chunk, offset)
+                write_time = monotonic() - start_time
+                client_log.info('Finished overwriting {} MB file! Moving to next file in ring...'.format(
+                    self.file_size))
+                self.send_file_rollover(write_time)
+                file_count += 1
+        except OSError:
+            client_log.info('ERROR: Could not write file in ring!')
+            self.handle_close()
+        except Exception:
+            client_log.info('ERROR: Unknown error during file ring write!')
+            self.handle_close()
+
+    def ring_file_name(self, index):
+        """Returns the path of the file at position index in this client's file ring."""
+        return config["client_file_path"] + 'client_' + str(self.client_id) + '_ring_' + str(index)
+
     ## MESSAGE SENDERS:
 
     def send_heartbeat(self):
-        """Thread: Sends a heartbeat message to the server every 'heartbeat_period' seconds. No response expected."""
+        """Thread: Sends a heartbeat message to the server every 'heartbeat_period' seconds. The server echoes
+        each heartbeat back and the round-trip time is recorded by the client's main process."""
         while not self.tests_done:
             time.sleep(config["heartbeat_period"])
             client_log.info('Heartbeat sent to server')
-            self.push(client_api["heartbeat"] + client_api["terminator"])
+            self.send_heartbeat_request()
 
     def send_performance_stats(self, pid):
         """Thread: Sends performance data of the file write operation to the server every 'perf_stats_period' seconds"""
@@ -317,9 +600,14 @@ class FileWriterClient(Client):
                         if line.split()[COLUMN_PID] == str(pid):
                             cpu = line.split()[COLUMN_CPU]
                             mem = line.split()[COLUMN_MEM]
-                            self.push(client_api["send_perf_stats"] + client_api["delimiter"] + 
-                                cpu + client_api["delimiter"] + 
-                                mem + client_api["terminator"])
+                            if self.shared_stats:
+                                from shm_transport import CHANNEL_PERF_STATS
+                                self.shared_stats.accumulate(self.shm_slot, CHANNEL_PERF_STATS,
+                                    (1, float(cpu), float(mem), 0))
+                            else:
+                                self.push(client_api["send_perf_stats"] + client_api["delimiter"] + 
+                                    cpu + client_api["delimiter"] + 
+                                    mem + self.timestamp() + client_api["terminator"])
                             client_log.info('File write performance stats sent to server. ' \
                                 '(CPU={} MEM={})'.format(cpu, mem))
                             return
@@ -328,17 +616,29 @@ class FileWriterClient(Client):
             else:
                 client_log.info('WARNING: Cannot get file write process statistics on non-Unix-based platforms.')     
 
-    def send_file_rollover(self):
-        self.push(client_api["file_rollover"] + client_api["terminator"])
+    def send_file_rollover(self, write_time):
+        """Informs the server that a file finished writing and how long (in seconds) the write took."""
+        if self.shared_stats:
+            from shm_transport import CHANNEL_FILE_ROLLOVER
+            self.shared_stats.accumulate(self.shm_slot, CHANNEL_FILE_ROLLOVER, (1, write_time, 0, 0))
+        else:
+            self.push(client_api["file_rollover"] + client_api["delimiter"] + repr(write_time) +
+                self.timestamp() + client_api["terminator"])
+
+    def send_file_alloc(self, alloc_time):
+        """Sends the file ring size and the time (in seconds) taken to preallocate it to the server."""
+        self.push(client_api["file_alloc"] + client_api["delimiter"] + str(self.ring_size) +
+            client_api["delimiter"] + repr(alloc_time) + self.timestamp() + client_api["terminator"])
 
     def send_file_stats(self):
         """Sends chunk size and file size to server for reporting."""
         client_log.info('File parameters sent to server.')
         self.push(client_api["send_file_stats"] + client_api["delimiter"] + str(self.chunk_size) +
-            client_api["delimiter"] + str(self.file_size) + client_api["terminator"])
+            client_api["delimiter"] + str(self.file_size) + self.timestamp() + client_api["terminator"])
 
 
 if __name__ == '__main__':
+    import argparse
     # Create FileWriterClient that writes files based on the arguments provided.
     parser = argparse.ArgumentParser()
     parser.add_argument('-r', '--runtime', dest='run_time', default=config["default_run_time"], type=int,
@@ -347,10 +647,13 @@ if __name__ == '__main__':
                         help='file size to write')
     parser.add_argument('-f', '--filesize', dest='file_size', default=config["default_file_size"], type=int,
                         help='file size to write')
+    parser.add_argument('-k', '--ringsize', dest='ring_size', default=config["file_ring_size"], type=int,
+                        help='number of preallocated files to overwrite in place (0 for a new file per rollover)')
     args = parser.parse_args()
 
     client = None
-    client = FileWriterClient(config["host"], config["port"], args.run_time, args.chunk_size, args.file_size)
+    client = FileWriterClient(config["host"], config["port"], args.run_time, args.chunk_size, args.file_size,
+                              args.ring_size)
     try:
         client.connect_to_server()
     except KeyboardInterrupt:
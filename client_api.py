@@ -15,8 +15,14 @@ client_api = {
     "send_perf_stats": 'send_stats',
     "send_file_stats": 'file_stats',
     "file_rollover": 'file_roll',
+    "file_alloc": 'file_alloc',
+    "shm_attach": 'shm_attach',
+    "send_rtt_stats": 'rtt_stats',
 
     # Server to client messages
     "set_client_id": 'set_cid',
     "run_tests": 'run_tests',
+    "heartbeat_ack": 'hb_ack',
+    "shm_attach_ack": 'shm_ack',
+    "shm_attach_nack": 'shm_nack',
 }
\ No newline at end of file
@@ -0,0 +1,214 @@
+__author__ = 'Wade Pentz'
+
+import array
+from config import config
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""client_table.py
+
+ClientTable stores the metrics of every client that connects to the server as a table of
+columns (struct-of-arrays) indexed by a dense slot id assigned when the client connects.
+Columns are NumPy arrays when NumPy is installed and standard library arrays otherwise.
+Keeping metrics out of the per-connection objects makes each client cost a few bytes per
+column, lets the server drop a client's connection object once it closes, and lets fleet
+wide aggregates (see report.py) be computed over whole columns at once.
+
+ClientRecord is a view of one row of the table. Its attributes read and write the row
+directly, so code that works with a single client (ex: ClientHandler) uses it like a
+regular object.
+"""
+
+NAN = float('nan')
+
+# Status values stored in the 'status' column as their index in this tuple
+STATUSES = ('NOT STARTED', 'RUNNING', 'PASS', 'ABORTED')
+
+# Table columns: (name, array typecode, value for a new row)
+COLUMNS = (
+    ('client_id', 'l', 0),
+    ('status', 'B', 0),
+    ('start_time', 'd', 0),
+    ('end_time', 'd', 0),
+    ('time_ran', 'd', 0),
+    ('ready_time', 'd', 0),
+    ('queue_wait', 'd', 0),
+    ('client_start_time', 'd', NAN),
+    ('client_end_time', 'd', NAN),
+    ('timing_skew', 'd', 0),
+    ('report_lag', 'd', 0),
+    ('heartbeats', 'l', 0),
+    ('rtt_count', 'l', 0),
+    ('rtt_p50', 'd', 0),
+    ('rtt_p95', 'd', 0),
+    ('rtt_p99', 'd', 0),
+    ('rtt_max', 'd', 0),
+    ('num_stat_reports', 'l', 0),
+    ('cpu_total', 'd', 0),
+    ('mem_total', 'd', 0),
+    ('chunk_size', 'l', 0),
+    ('file_size', 'l', 0),
+    ('files_written', 'l', 0),
+    ('write_time_total', 'd', 0),
+    ('ring_size', 'l', 0),
+    ('alloc_time', 'd', 0),
+)
+
+
+def new_column(typecode, length):
+    if numpy is not None:
+        return numpy.zeros(length, dtype=typecode)
+    return array.array(typecode, [0]) * length
+
+
+def ratio(numerators, denominators):
+    """Element-wise numerators / denominators, with 0 wherever the denominator is not positive."""
+    if numpy is not None:
+        positive = denominators > 0
+        return numpy.where(positive, numerators / numpy.where(positive, denominators, 1).astype('d'), 0)
+    return [float(n) / d if d > 0 else 0 for n, d in zip(numerators, denominators)]
+
+
+class ClientTable(object):
+    """Column-oriented table of client metrics, one row per client.
+
+    Args:
+        capacity (int): number of rows to allocate up front. The table doubles in size whenever it is full.
+    """
+
+    def __init__(self, capacity=config["client_table_capacity"]):
+        self.size = 0
+        self.capacity = max(capacity, 1)
+        self.columns = dict((name, new_column(typecode, self.capacity)) for name, typecode, default in COLUMNS)
+
+    def add_row(self):
+        """Adds a row of default values. Returns its slot id."""
+        if self.size == self.capacity:
+            self.grow()
+        slot = self.size
+        self.size += 1
+        for name, typecode, default in COLUMNS:
+            self.columns[name][slot] = default
+        return slot
+
+    def grow(self):
+        for name, typecode, default in COLUMNS:
+            if numpy is not None:
+                self.columns[name] = numpy.concatenate((self.columns[name], new_column(typecode, self.capacity)))
+            else:
+                self.columns[name].extend(new_column(typecode, self.capacity))
+        self.capacity *= 2
+
+    def column(self, name):
+        """Returns the values of a column for every row in the table."""
+        return self.columns[name][:self.size]
+
+    def metric(self, name):
+        """Returns the values of a column or of a derived metric (cpu_avg, mem_avg, write_rate, file_write_time)
+        for every row."""
+        if name == 'cpu_avg':
+            return ratio(self.column('cpu_total'), self.column('num_stat_reports'))
+        if name == 'mem_avg':
+            return ratio(self.column('mem_total'), self.column('num_stat_reports'))
+        if name == 'write_rate':
+            files_written, file_size = self.column('files_written'), self.column('file_size')
+            if numpy is not None:
+                megabytes = files_written * file_size
+            else:
+                megabytes = [files * size for files, size in zip(files_written, file_size)]
+            return ratio(megabytes, self.column('write_time_total'))
+        if name == 'file_write_time':
+            return ratio(self.column('write_time_total'), self.column('files_written'))
+        return self.column(name)
+
+    def started(self):
+        """Returns, for every row, whether the client started running. Only clients whose start was recorded count,
+        so a client that aborted before starting is not included."""
+        if numpy is not None:
+            return self.column('start_time') != 0
+        return [start_time != 0 for start_time in self.column('start_time')]
+
+    def sorted_metric(self, name):
+        """Returns the values of a metric for every client that started running, in ascending order."""
+        if numpy is not None:
+            return numpy.sort(self.metric(name)[self.started()])
+        return sorted(value for value, started in zip(self.metric(name), self.started()) if started)
+
+
+class Column(object):
+    """Descriptor for a ClientRecord attribute that is stored in the record's row of its table."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, record, owner):
+        if record is None:
+            return self
+        return record.table.columns[self.name][record.slot]
+
+    def __set__(self, record, value):
+        record.table.columns[self.name][record.slot] = value
+
+
+class OptionalColumn(Column):
+    """Column whose attribute may be None, which is stored as NaN."""
+
+    def __get__(self, record, owner):
+        value = Column.__get__(self, record, owner)
+        if record is not None and value != value:
+            return None
+        return value
+
+    def __set__(self, record, value):
+        Column.__set__(self, record, NAN if value is None else value)
+
+
+class StatusColumn(Column):
+    """Column whose attribute is one of STATUSES, stored as its index."""
+
+    def __get__(self, record, owner):
+        if record is None:
+            return self
+        return STATUSES[Column.__get__(self, record, owner)]
+
+    def __set__(self, record, value):
+        Column.__set__(self, record, STATUSES.index(value))
+
+
+class ClientRecord(object):
+    """View of one client's row in a ClientTable.
+
+    Args:
+        table (ClientTable): table holding the client's metrics.
+        slot (int): the client's row in the table.
+    """
+
+    __slots__ = ('table', 'slot')
+
+    status = StatusColumn('status')
+    client_start_time = OptionalColumn('client_start_time')
+    client_end_time = OptionalColumn('client_end_time')
+
+    def __init__(self, table, slot):
+        self.table = table
+        self.slot = slot
+
+    @property
+    def cpu_avg(self):
+        return self.cpu_total / self.num_stat_reports if self.num_stat_reports else 0
+
+    @property
+    def mem_avg(self):
+        return self.mem_total / self.num_stat_reports if self.num_stat_reports else 0
+
+    @property
+    def write_rate(self):
+        return float(self.files_written * self.file_size) / self.write_time_total if self.write_time_total > 0 else 0
+
+
+for name, typecode, default in COLUMNS:
+    if name not in ClientRecord.__dict__:
+        setattr(ClientRecord, name, Column(name))
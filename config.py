@@ -5,6 +5,8 @@ config = {
     # Log configuration
     "server_log_path": './server_logs/',
     "client_log_path": './client_logs/',
+    "server_report_path": './server_reports/',
+    "report_client_details": True,  # False leaves per-client data out of the log (it is always in the CSV)
 
     # Network configuration
     "host": 'localhost',
@@ -13,6 +15,27 @@ config = {
     "server_loop_count": 1,
     "client_timeout": 0.5,
     "first_client_id": 100,
+    "replay_timeout": 0.01,
+    "listen_backlog": 128,
+    "client_table_capacity": 1024,
+
+    # Admission control
+    "max_running_clients": 0,  # 0 runs every client as soon as it is ready
+    "start_stagger": 0,  # minimum seconds between test requests sent to waiting clients
+    "start_jitter": 0,  # random extra seconds (up to this value) added to each stagger
+
+    # Shared-memory telemetry for clients on the same host as the server
+    "shm_transport": False,
+    "shm_path": '/dev/shm/server_client_model_stats',
+    "shm_slots": 1024,
+    "shm_poll_period": 0.5,
+
+    # Baseline comparison (regression detection between runs)
+    "baseline_path": './server_baselines/',
+    "baseline_resamples": 1000,  # bootstrap resamples per compared statistic
+    "baseline_confidence": 0.95,
+    "baseline_min_samples": 3,  # passing clients needed per configuration in both runs
+    "baseline_min_change": 0.05,  # smallest relative change flagged as a regression or improvement
 
     # Client configuration
     "client_file_path": './client_files/',
@@ -23,4 +46,13 @@ config = {
     "perf_stats_period": 10,
     "done_check_period": 0.5,
     "chunk_size_minimum": 10,
+    "file_ring_size": 0,  # 0 writes a new file on every rollover, >0 overwrites a fixed ring of preallocated files
+
+    # Autotune configuration
+    "autotune_max_chunk_size": 80,
+    "autotune_min_file_size": 50,
+    "autotune_max_file_size": 200,
+    "autotune_min_trials": 3,
+    "autotune_max_trials": 10,
+    "autotune_fsync": False,  # True measures throughput to the device (not comparable with client write rates)
 }
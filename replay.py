@@ -0,0 +1,130 @@
+__author__ = 'Wade Pentz'
+
+import asyncore
+import asynchat
+import socket
+import argparse
+from config import config
+from client_api import client_api
+from timing import monotonic
+from capture import read_capture
+from logs import client_log
+
+"""replay.py
+
+Replays client sessions recorded by the server's message capture (see capture.py) against
+a running server. This allows the server's message dispatch, logging, and reporting to be
+benchmarked with a realistic message mix without running real FileWriterClients, and
+therefore without any disk I/O on the client side.
+
+Each captured client id becomes one session. Sessions can be replayed at their original
+pace, sped up by any factor, or as fast as possible (speed of 0). Every session can also be
+replayed over several concurrent connections to multiply the load on the server.
+
+Example usage is shown in the "if __name__ == '__main__':" block at the end of this file.
+    ex: python replay.py -f capture.bin -s 10 -n 4
+"""
+
+class ReplayClient(asynchat.async_chat):
+    """Connects to the server and re-sends the messages of one captured client session.
+
+    Args:
+        host (str): test server address to connect to
+        port (int): port test server is listening on
+        messages (list): (timestamp, msg) tuples in the order they were captured
+    """
+
+    def __init__(self, host, port, messages):
+        asynchat.async_chat.__init__(self)
+        self.messages = messages
+        self.next_msg = 0
+        self.sending_done = False
+        self.finished = False
+        self.set_terminator(client_api["terminator"])
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect((host, port))
+
+    def pump(self, elapsed):
+        """Pushes every message captured at or before 'elapsed' seconds into the session.
+        Once all messages have been sent the sending side of the connection is shut down. The server's replies
+        are still read until it closes the connection: closing with unread replies would reset the connection
+        and the server would drop the rest of the session."""
+        if not self.connected or self.sending_done:
+            return
+        while self.next_msg < len(self.messages) and self.messages[self.next_msg][0] <= elapsed:
+            self.push(self.messages[self.next_msg][1] + client_api["terminator"])
+            self.next_msg += 1
+        if self.done() and not self.producer_fifo:
+            self.socket.shutdown(socket.SHUT_WR)
+            self.sending_done = True
+
+    def done(self):
+        return self.next_msg >= len(self.messages)
+
+    def collect_incoming_data(self, data):
+        """Server responses are not needed for replay and are discarded."""
+        pass
+
+    def found_terminator(self):
+        pass
+
+    def handle_close(self):
+        self.close()
+
+    def close(self):
+        asynchat.async_chat.close(self)
+        self.finished = True
+
+
+def load_sessions(file_name):
+    """Groups the records of a capture file into sessions. Returns a dictionary of client_id -> [(timestamp, msg)]."""
+    sessions = {}
+    for timestamp, client_id, msg in read_capture(file_name):
+        sessions.setdefault(client_id, []).append((timestamp, msg))
+    return sessions
+
+
+def replay(file_name, host, port, speed=1.0, connections=1):
+    """Replays every session in the capture file against the server.
+
+    Args:
+        file_name (str): capture file to replay.
+        host (str): test server address to connect to.
+        port (int): port test server is listening on.
+        speed (float): replay speed multiplier (1 for original pace, 0 for as fast as possible).
+        connections (int): number of concurrent connections to open per captured session.
+
+    Returns the number of messages sent and the time taken to send them."""
+    sessions = load_sessions(file_name)
+    clients = [ReplayClient(host, port, messages) for i in range(connections) for messages in sessions.values()]
+    client_log.info('Replaying {} session(s) over {} connection(s)...'.format(len(sessions), len(clients)))
+    start_time = monotonic()
+    while not all(client.finished for client in clients):
+        if speed:
+            elapsed = (monotonic() - start_time) * speed
+        else:
+            elapsed = float('inf')
+        for client in clients:
+            client.pump(elapsed)
+        asyncore.loop(timeout=config["replay_timeout"], count=1)
+    run_time = monotonic() - start_time
+    msgs_sent = sum(client.next_msg for client in clients)
+    client_log.info('Replay complete: {} messages sent in {:.2f} sec ({:.0f} msgs/sec)'.format(
+        msgs_sent, run_time, msgs_sent / run_time if run_time else 0))
+    return msgs_sent, run_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--file', dest='file_name', required=True,
+                        help='capture file recorded by the server')
+    parser.add_argument('-s', '--speed', dest='speed', default=1.0, type=float,
+                        help='replay speed multiplier (0 replays as fast as possible)')
+    parser.add_argument('-n', '--connections', dest='connections', default=1, type=int,
+                        help='number of concurrent connections per captured session')
+    args = parser.parse_args()
+
+    try:
+        replay(args.file_name, config["host"], config["port"], args.speed, args.connections)
+    except KeyboardInterrupt:
+        client_log.info('Keyboard interrupt: Stopping replay...')
@@ -0,0 +1,135 @@
+__author__ = 'Wade Pentz'
+
+import os
+import csv
+import json
+from client_table import COLUMNS, STATUSES, numpy
+
+"""report.py
+
+FleetReport summarizes every client in the server's ClientTable at the end of a run:
+how many clients ended in each status, percentiles of throughput, latency, and resource
+usage across clients, and which clients are outliers in throughput. The summary is
+logged in a handful of lines and exported as JSON, and the full per-client table is
+exported as CSV. Each export is written in a single pass over the table's columns
+through one buffered file, so report time grows only with the number of clients and
+not with the number of log calls.
+
+Percentiles use the nearest-rank method. Outliers are clients whose write rate falls
+outside Tukey's fences (1.5 interquartile ranges beyond the 25th and 75th percentiles).
+"""
+
+# Metrics summarized across clients: (ClientTable metric, unit)
+REPORT_METRICS = (
+    ('write_rate', 'MB/s'),
+    ('file_write_time', 'sec'),
+    ('rtt_p50', 'sec'),
+    ('rtt_p99', 'sec'),
+    ('time_ran', 'sec'),
+    ('queue_wait', 'sec'),
+    ('cpu_avg', '%'),
+    ('mem_avg', '%'),
+)
+PERCENTILES = (0, 5, 25, 50, 75, 95, 99, 100)
+OUTLIER_METRIC = 'write_rate'
+TUKEY_FENCE = 1.5
+# Derived metrics exported alongside the stored columns in the CSV
+CSV_METRICS = ('cpu_avg', 'mem_avg', 'write_rate', 'file_write_time')
+FILE_BUFFER_SIZE = 1024 * 1024
+
+
+def as_list(values):
+    """Returns a column or metric as a plain Python list (converting NumPy arrays in one call)."""
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        return values.tolist()
+    return list(values)
+
+
+class FleetReport(object):
+    """Fleet-wide summary of a run built from the server's client table.
+
+    Args:
+        table (ClientTable): table holding the metrics of every client that connected.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def percentiles(self, name):
+        """Returns {percentile: value} for a metric over the clients that started, or None if none did."""
+        ordered = self.table.sorted_metric(name)
+        if not len(ordered):
+            return None
+        return dict((pct, float(ordered[int(round(pct / 100.0 * (len(ordered) - 1)))])) for pct in PERCENTILES)
+
+    def status_counts(self):
+        counts = dict((status, 0) for status in STATUSES)
+        for code in as_list(self.table.column('status')):
+            counts[STATUSES[code]] += 1
+        return counts
+
+    def outliers(self, name=OUTLIER_METRIC):
+        """Returns the ids of started clients whose metric falls outside Tukey's fences, lowest first."""
+        percentiles = self.percentiles(name)
+        if not percentiles:
+            return []
+        spread = TUKEY_FENCE * (percentiles[75] - percentiles[25])
+        low, high = percentiles[25] - spread, percentiles[75] + spread
+        outliers = [(value, client_id) for value, client_id, started in
+                    zip(as_list(self.table.metric(name)), as_list(self.table.column('client_id')),
+                        as_list(self.table.started()))
+                    if started and not low <= value <= high]
+        return [client_id for value, client_id in sorted(outliers)]
+
+    def summary(self):
+        """Returns the fleet summary as a dictionary suitable for JSON export."""
+        return {
+            "clients": self.table.size,
+            "status_counts": self.status_counts(),
+            "metrics": dict((name, {"unit": unit, "percentiles": self.percentiles(name)})
+                            for name, unit in REPORT_METRICS),
+            "outliers": {OUTLIER_METRIC: self.outliers()},
+        }
+
+    def log_summary(self, log, summary):
+        """Writes the fleet summary to a logger."""
+        log.info('Fleet summary ({} clients): {}'.format(summary["clients"], ', '.join(
+            '{} {}'.format(summary["status_counts"][status], status) for status in STATUSES)))
+        log.info('    Metric (min / p50 / p95 / p99 / max):')
+        for name, unit in REPORT_METRICS:
+            percentiles = summary["metrics"][name]["percentiles"]
+            if percentiles:
+                log.info('    {:<16} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f} {}'.format(
+                    name + ':', percentiles[0], percentiles[50], percentiles[95], percentiles[99], percentiles[100],
+                    unit))
+        if summary["outliers"][OUTLIER_METRIC]:
+            log.info('    {} outliers: {}'.format(OUTLIER_METRIC, ', '.join(
+                str(client_id) for client_id in summary["outliers"][OUTLIER_METRIC])))
+
+    def write_json(self, file_name, summary):
+        with open(file_name, 'w', FILE_BUFFER_SIZE) as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+
+    def write_csv(self, file_name):
+        """Writes one row per client with every stored column and derived metric."""
+        names = [name for name, typecode, default in COLUMNS] + list(CSV_METRICS)
+        columns = [as_list(self.table.metric(name)) for name in names]
+        columns[names.index('status')] = [STATUSES[code] for code in columns[names.index('status')]]
+        with open(file_name, 'wb', FILE_BUFFER_SIZE) as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            writer.writerows(zip(*columns))
+
+    def export(self, path, name, **extra):
+        """Writes <path><name>.json (summary plus any extra fields) and <path><name>.csv (per-client table).
+        Returns the fleet summary."""
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+        summary = self.summary()
+        summary.update(extra)
+        self.write_json(path + name + '.json', summary)
+        self.write_csv(path + name + '.csv')
+        return summary
@@ -6,9 +6,20 @@ import logging
 import asyncore
 import asynchat
 import socket
+import sys
+import random
+import argparse
+from collections import deque
 from config import config
 from client_api import client_api
+from timing import monotonic
 from logs import server_log, file_formatter
+from capture import MessageCapture
+from shm_transport import SharedStatsTable, slot_for_client, CHANNEL_PERF_STATS, CHANNEL_FILE_ROLLOVER
+from client_table import ClientTable, ClientRecord
+from report import FleetReport
+from baseline import build_baseline, save_baseline, load_baseline, compare, log_comparisons, gate_status, \
+    GATE_NO_VERDICT
 
 """server.py
 
@@ -19,12 +30,37 @@ string-based messaging protocol that is defined in client_api.py. Clients are al
 tracked using sequential client ids that are assigned upon connection and sent to the
 client upon the client's request.
 
+Client metrics are kept in a column-oriented ClientTable (see client_table.py) rather
+than in the ClientHandler objects, which are dropped once their connection closes. The
+report is generated from the table. It logs a fleet summary (see report.py) with client
+counts by status, percentiles of the main metrics across clients, and throughput outliers,
+and exports the summary as JSON and the per-client data as CSV to ./server_reports.
+The per-client blocks in the log can be turned off with config["report_client_details"].
+
 The server logs client connections and messages to the console and to a file saved 
 to ./server_logs named 'server_log_<date&time>'. Once all clients have finished
 running, the server writes a report displaying statistics for each client including
 how long they ran, file write information, performance stats, and status into the 
 log file. If clients drop out before finishing that is logged.
 
+Clients that report ready are admitted in FIFO order. The number of clients allowed to run
+at once can be limited and test requests can be spread out with a fixed and/or random delay
+between them so that clients connecting together do not all start writing at the same
+moment. The time each client spent waiting to be admitted is included in the report.
+
+Optionally, every message received from clients can be recorded to a capture file
+(see capture.py) which replay.py can later re-inject to benchmark the server alone.
+
+If the shared-memory transport is enabled in config.py the server also creates a shared
+stats table (see shm_transport.py). Clients on the same host publish their performance
+stats and file rollovers into it and the server polls it from its main loop.
+
+Clients timestamp their report messages with their own monotonic clock. The reported time
+ran is measured on the client's clock, and the report also shows how much the server's
+view of the run differed from it and the largest delay seen on any report message. The
+server echoes every heartbeat back to its client and the client reports percentiles of
+the resulting round-trip times.
+
 Example usage of this class is shown in the "if __name__ == '__main__':" block at
 the end of this file.
 
@@ -36,14 +72,24 @@ class Server(asyncore.dispatcher):
     Args:
         host (str): address where test server will run.
         port (int): network port the server will run on.
+        capture_file (str): optional path of a file to record all inbound client messages to.
     """
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, capture_file=None):
         asyncore.dispatcher.__init__(self)
         self.host = host
         self.port = port
+        self.capture = MessageCapture(capture_file) if capture_file else None
+        self.shared_stats = None
+        self.last_shm_poll = 0
+        self.wait_queue = deque()
+        self.admitted = set()
+        self.next_dispatch_time = 0
+        if config["shm_transport"]:
+            self.shared_stats = SharedStatsTable(config["shm_path"], config["shm_slots"], create=True)
         self.client_id = config["first_client_id"]
         self.client_list = {}
+        self.client_table = ClientTable()
         self.start_time = ''
         self.end_time = ''
         self.init_log_file()
@@ -68,7 +114,7 @@ class Server(asyncore.dispatcher):
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
         self.set_reuse_addr()
         self.bind((self.host, self.port))
-        self.listen(5)
+        self.listen(config["listen_backlog"])
         server_log.info('Initialization complete!')
 
     def start_server(self):
@@ -82,7 +128,7 @@ class Server(asyncore.dispatcher):
         if pair is not None:
             sock, addr = pair
             server_log.info('Client connection from {}, assigning client id {}'.format(repr(addr), self.client_id))
-            handler = ClientHandler(sock, addr, self.client_id)
+            handler = ClientHandler(sock, addr, self.client_id, self.capture, self.shared_stats, self)
             self.client_list.update({self.client_id: handler})
             self.client_id += 1
 
@@ -90,15 +136,65 @@ class Server(asyncore.dispatcher):
         server_log.info('Server shutting down...')
         self.close()
 
+    def close(self):
+        asyncore.dispatcher.close(self)
+        if self.capture:
+            self.capture.close()
+            self.capture = None
+        if self.shared_stats:
+            self.shared_stats.close(remove=True)
+            self.shared_stats = None
+
     def run_loop(self):
         """Run asyncore.loop until all clients are closed"""
         server_log.info('Server now accepting client connections.')
         while not self.clients_done():
             asyncore.loop(timeout=config["server_timeout"], count=config["server_loop_count"])
+            self.dispatch_waiting()
+            self.poll_shared_stats()
+
+    def request_start(self, handler):
+        """Queues a ready client to be sent its test request once it is admitted."""
+        handler.ready_time = monotonic()
+        self.wait_queue.append(handler)
+        self.dispatch_waiting()
+        if handler in self.wait_queue:
+            server_log.info(str(handler.client_id) + ': Client queued ({} waiting)'.format(len(self.wait_queue)))
+
+    def dispatch_waiting(self):
+        """Sends test requests to queued clients in FIFO order while fewer than 'max_running_clients' are running
+        and the stagger since the previous test request has elapsed."""
+        while self.wait_queue:
+            if config["max_running_clients"] and len(self.admitted) >= config["max_running_clients"]:
+                return
+            if monotonic() < self.next_dispatch_time:
+                return
+            handler = self.wait_queue.popleft()
+            self.admitted.add(handler)
+            handler.send_run_tests()
+            self.next_dispatch_time = monotonic() + config["start_stagger"] + random.uniform(0, config["start_jitter"])
+
+    def release(self, handler):
+        """Frees the admission slot (or queue position) and connection object of a client that has closed.
+        The client's metrics remain in the client table."""
+        self.client_list.pop(handler.client_id, None)
+        self.admitted.discard(handler)
+        if handler in self.wait_queue:
+            self.wait_queue.remove(handler)
+        self.dispatch_waiting()
+
+    def poll_shared_stats(self):
+        """Reads the stats of all running clients attached to the shared stats table every 'shm_poll_period' seconds."""
+        if not self.shared_stats or monotonic() - self.last_shm_poll < config["shm_poll_period"]:
+            return
+        self.last_shm_poll = monotonic()
+        for client in self.client_list.values():
+            if client.shm_slot is not None and client.status == 'RUNNING':
+                client.read_shared_stats()
 
     def clients_done(self):
         """Returns True if all clients have completed their tests and at least one client has connected."""
-        if not self.client_list:
+        if not self.client_list and not self.client_table.size:
             return False
         elif len(asyncore.socket_map) > 1:
             return False
@@ -114,58 +210,101 @@ class Server(asyncore.dispatcher):
         server_log.info('    Start time: {}'.format(self.start_time))
         server_log.info('    End time:   {}'.format(self.end_time))
         server_log.info('')
-        server_log.info('Total of {} client(s) ran. Data for each client:'.format(len(self.client_list)))
-        for client in self.client_list.values():
+        server_log.info('Total of {} client(s) ran.'.format(self.client_table.size))
+        if config["report_client_details"]:
+            self.write_client_details()
+        server_log.info('---------------------------------------------------------')
+        report = FleetReport(self.client_table)
+        report_name = 'server_report_' + time.strftime('%Y-%m-%d_%H.%M.%S')
+        summary = report.export(config["server_report_path"], report_name,
+                                start_time=self.start_time, end_time=self.end_time)
+        report.log_summary(server_log, summary)
+        server_log.info('Fleet report written to {}{}.json and .csv'.format(config["server_report_path"], report_name))
+        server_log.info('=========================================================')
+        server_log.info('')
+
+    def save_baseline(self, name):
+        """Saves the metrics of every client that passed as a named baseline for later runs to be compared against."""
+        file_name = save_baseline(build_baseline(self.client_table), name)
+        server_log.info('Baseline "{}" written to {}'.format(name, file_name))
+
+    def compare_baseline(self, name, baseline):
+        """Compares this run against a baseline loaded with load_baseline() and logs the result.
+        Returns the exit status of the performance gate (see baseline.gate_status())."""
+        comparisons = compare(baseline, build_baseline(self.client_table))
+        log_comparisons(server_log, name, comparisons)
+        status = gate_status(comparisons)
+        if status == GATE_NO_VERDICT:
+            server_log.info('    No statistic could be compared against the baseline')
+        return status
+
+    def write_client_details(self):
+        """Writes a block of data for each client into the log."""
+        server_log.info('Data for each client:')
+        for slot in range(self.client_table.size):
+            client = ClientRecord(self.client_table, slot)
             server_log.info('---------------------------------------------------------')
             server_log.info('  Client {}'.format(client.client_id))
             server_log.info('    Test status:   {}'.format(client.status))
             server_log.info('    Time ran:      {:.2f} sec'.format(client.time_ran)) 
+            server_log.info('    Queue wait:    {:.2f} sec'.format(client.queue_wait))
+            server_log.info('    Timing skew:   {:+.2f} ms'.format(client.timing_skew * 1000))
+            server_log.info('    Max msg lag:   {:.2f} ms'.format(client.report_lag * 1000))
+            server_log.info('    Heartbeat RTT: p50 {:.2f} / p95 {:.2f} / p99 {:.2f} / max {:.2f} ms ({} samples)'
+                .format(client.rtt_p50 * 1000, client.rtt_p95 * 1000, client.rtt_p99 * 1000, client.rtt_max * 1000,
+                client.rtt_count))
             server_log.info('    Avg CPU usage: {:.2f}%'.format(client.cpu_avg))
             server_log.info('    Avg MEM usage: {:.2f}%'.format(client.mem_avg))
             server_log.info('    Files written: {}'.format(client.files_written))
             server_log.info('    File size:     {}'.format(client.file_size))
             server_log.info('    Chunk size:    {}'.format(client.chunk_size))
-        server_log.info('=========================================================')
-        server_log.info('')
+            server_log.info('    Write rate:    {:.2f} MB/s'.format(client.write_rate))
+            if client.ring_size:
+                server_log.info('    Ring size:     {}'.format(client.ring_size))
+                server_log.info('    Alloc time:    {:.2f} sec'.format(client.alloc_time))
 
 
-class ClientHandler(asynchat.async_chat):
-    """Class instantiated to keep track of each client that connects to the server.
+class ClientHandler(asynchat.async_chat, ClientRecord):
+    """Class instantiated to keep track of each client that connects to the server. The client's metrics are
+    stored in its row of the server's client table (see ClientRecord).
 
     Args:
         sock (int): socket on which the client is connected.
         addr (int): address on which the client is connected.
         id (int): unique identifier for client.
+        capture (MessageCapture): optional capture that every received message is recorded to.
+        shared_stats (SharedStatsTable): optional shared stats table that co-located clients can publish to.
+        server (Server): optional server that admits the client to run and holds the client table. Without one
+            the client starts when ready and its metrics are kept in a table of its own.
     """
 
-    def __init__(self, sock, addr, client_id):
+    # Name of the handler method for each command. Shared by all instances rather than bound per client.
+    msg_handler = { client_api["get_client_id"]: 'handle_get_client_id',
+                    client_api["ready"]: 'handle_ready',
+                    client_api["start"]: 'handle_start',
+                    client_api["done"]: 'handle_done',
+                    client_api["heartbeat"]: 'handle_heartbeat',
+                    client_api["send_perf_stats"]: 'handle_perf_stats',
+                    client_api["send_file_stats"]: 'handle_file_stats',
+                    client_api["file_rollover"]: 'handle_file_rollover',
+                    client_api["file_alloc"]: 'handle_file_alloc',
+                    client_api["shm_attach"]: 'handle_shm_attach',
+                    client_api["send_rtt_stats"]: 'handle_rtt_stats', }
+
+    def __init__(self, sock, addr, client_id, capture=None, shared_stats=None, server=None):
         asynchat.async_chat.__init__(self, sock=sock)
+        table = server.client_table if server else ClientTable(1)
+        ClientRecord.__init__(self, table, table.add_row())
         self.addr = addr
         self.client_id = client_id
+        self.capture = capture
+        self.shared_stats = shared_stats
+        self.server = server
+        self.shm_slot = None
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.set_terminator(client_api["terminator"])
-        self.start_time = 0
-        self.end_time = 0
-        self.time_ran = 0
-        self.num_stat_reports = 0
-        self.cpu_avg = 0
-        self.mem_avg = 0
-        self.cpu_total = 0
-        self.mem_total = 0
-        self.chunk_size = 0
-        self.file_size = 0
-        self.files_written = 0
-        self.status = 'NOT STARTED'
         self.msg_buffer = []
-        self.msg = ''
         self.msg_split = []
-        self.msg_handler = { client_api["get_client_id"]: self.handle_get_client_id,
-                             client_api["ready"]: self.handle_ready,
-                             client_api["start"]: self.handle_start,
-                             client_api["done"]: self.handle_done,
-                             client_api["heartbeat"]: self.handle_heartbeat,
-                             client_api["send_perf_stats"]: self.handle_perf_stats,
-                             client_api["send_file_stats"]: self.handle_file_stats,
-                             client_api["file_rollover"]: self.handle_file_rollover, }
 
     def collect_incoming_data(self, data):
         """Buffer incoming message"""
@@ -173,11 +312,13 @@ class ClientHandler(asynchat.async_chat):
 
     def found_terminator(self):
         """Processes the incoming message by looking up the handler in the message dictionary."""
-        self.msg = ''.join(self.msg_buffer)
-        self.msg_split = self.msg.split(client_api["delimiter"])
+        msg = ''.join(self.msg_buffer)
+        self.msg_split = msg.split(client_api["delimiter"])
         cmd = self.msg_split[0]
+        if self.capture:
+            self.capture.record(self.client_id, msg)
         try:
-            self.msg_handler[cmd]()
+            getattr(self, self.msg_handler[cmd])()
         except KeyError as e:
             server_log.info('Unhandled command received from client id {}: {}'.format(self.client_id, cmd))
         except Exception as e:
@@ -185,17 +326,56 @@ class ClientHandler(asynchat.async_chat):
             raise e
         finally:
             self.msg_buffer = []
-            self.msg = ''
             self.msg_split = []
 
     def handle_close(self):
-        """Sets test status and closes connection."""
-        self.end_time = time.time()
-        self.time_ran = self.end_time - self.start_time
+        """Sets test status and closes connection. time_ran is left at 0 for a client that never started."""
+        self.end_time = monotonic()
+        if self.start_time:
+            self.time_ran = self.end_time - self.start_time
+        if self.client_start_time is not None and self.client_end_time is not None:
+            # Prefer the client's own clock so server loop delays do not inflate the run time
+            self.timing_skew = self.time_ran - (self.client_end_time - self.client_start_time)
+            self.time_ran = self.client_end_time - self.client_start_time
+        if self.shm_slot is not None:
+            self.read_shared_stats()
         if self.status != 'PASS':
             server_log.info('Client {} aborted!'.format(self.client_id))
             self.status = 'ABORTED'
+        # Drop any messages still buffered behind the one that closed the session so they are not processed
+        self.discard_buffers()
         self.close()
+        if self.server:
+            self.server.release(self)
+
+    def send_run_tests(self):
+        """Sends the test request to the client."""
+        self.queue_wait = monotonic() - self.ready_time
+        server_log.info(str(self.client_id) + ': Sending test request')
+        self.push(client_api["run_tests"] + client_api["terminator"])
+
+    def read_shared_stats(self):
+        """Updates the client's stats from its slot in the shared stats table."""
+        perf_stats = self.shared_stats.read(self.shm_slot, CHANNEL_PERF_STATS)
+        if perf_stats and perf_stats[0]:
+            count, self.cpu_total, self.mem_total, unused = perf_stats[1]
+            self.num_stat_reports = int(count)
+        file_rollover = self.shared_stats.read(self.shm_slot, CHANNEL_FILE_ROLLOVER)
+        if file_rollover and file_rollover[0]:
+            count, self.write_time_total, unused, unused = file_rollover[1]
+            self.files_written = int(count)
+
+    def track_client_time(self, index):
+        """Returns the client's monotonic timestamp at msg_split[index], or None if the message does not carry one.
+        Also updates report_lag: how much later (relative to the start message) the server processed the message
+        than the client sent it."""
+        if len(self.msg_split) <= index:
+            return None
+        client_time = float(self.msg_split[index])
+        if self.client_start_time is not None:
+            lag = (monotonic() - self.start_time) - (client_time - self.client_start_time)
+            self.report_lag = max(self.report_lag, lag)
+        return client_time
 
     ## MESSAGE HANDLERS:
 
@@ -204,26 +384,37 @@ class ClientHandler(asynchat.async_chat):
         self.push(client_api["set_client_id"] + client_api["delimiter"] + str(self.client_id) + client_api["terminator"])
 
     def handle_ready(self):
-        server_log.info(str(self.client_id) + ': Client ready, sending test request')
-        self.push(client_api["run_tests"] + client_api["terminator"])
+        server_log.info(str(self.client_id) + ': Client ready')
+        if self.server:
+            self.server.request_start(self)
+        else:
+            self.ready_time = monotonic()
+            self.send_run_tests()
 
     def handle_start(self):
         server_log.info(str(self.client_id) + ': Client started running tests')
         self.status = 'RUNNING'
-        self.start_time = time.time()
+        self.start_time = monotonic()
+        self.client_start_time = self.track_client_time(1)
 
     def handle_done(self):
         server_log.info(str(self.client_id) + ': Client finished running tests')
         self.status = 'PASS'
+        self.client_end_time = self.track_client_time(1)
         self.handle_close()
 
     def handle_heartbeat(self):
         server_log.info(str(self.client_id) + ': Heartbeat received')
+        self.heartbeats += 1
+        if len(self.msg_split) == 2:
+            self.push(client_api["heartbeat_ack"] + client_api["delimiter"] + self.msg_split[1] +
+                client_api["terminator"])
 
     def handle_perf_stats(self):
-        if len(self.msg_split) == 3:
+        if len(self.msg_split) in (3, 4):
             cpu = self.msg_split[1]
             mem = self.msg_split[2]
+            self.track_client_time(3)
             server_log.info(str(self.client_id) + ': Performance stats received. CPU: {} Mem: {}'.format(cpu, mem))
         else:
             server_log.info(str(self.client_id) + ': Invalid performance stats received')
@@ -231,14 +422,13 @@ class ClientHandler(asynchat.async_chat):
         self.num_stat_reports += 1
         self.cpu_total += float(cpu)
         self.mem_total += float(mem)
-        self.cpu_avg = self.cpu_total / self.num_stat_reports
-        self.mem_avg = self.mem_total / self.num_stat_reports
         return True
 
     def handle_file_stats(self):
-        if len(self.msg_split) == 3:
+        if len(self.msg_split) in (3, 4):
             self.chunk_size = int(self.msg_split[1])
             self.file_size = int(self.msg_split[2])
+            self.track_client_time(3)
             server_log.info(str(self.client_id) + ': File stats received. \
                 Chunk size: {} File size: {}'.format(self.chunk_size, self.file_size))
             return True
@@ -249,13 +439,81 @@ class ClientHandler(asynchat.async_chat):
     def handle_file_rollover(self):
         server_log.info(str(self.client_id) + ': File rolled over')
         self.files_written += 1
+        if len(self.msg_split) in (2, 3):
+            self.write_time_total += float(self.msg_split[1])
+            self.track_client_time(2)
+
+    def handle_file_alloc(self):
+        if len(self.msg_split) in (3, 4):
+            self.ring_size = int(self.msg_split[1])
+            self.alloc_time = float(self.msg_split[2])
+            self.track_client_time(3)
+            server_log.info(str(self.client_id) + ': File ring of {} preallocated in {:.2f} sec'.format(
+                self.ring_size, self.alloc_time))
+            return True
+        else:
+            server_log.info(str(self.client_id) + ': Invalid file allocation stats received')
+            return False
+
+    def handle_shm_attach(self):
+        """Attaches the client to its slot in the shared stats table and acknowledges it. Only the slot that belongs
+        to the client's id is accepted, so a client cannot publish into (and mix its totals with) another client's
+        slot, and only if the client opened this server's table file (not a stale one or one on another host).
+        Otherwise the request is rejected and the client keeps sending its stats over TCP."""
+        if len(self.msg_split) == 4 and self.shared_stats and \
+                int(self.msg_split[1]) == slot_for_client(self.client_id, self.shared_stats.num_slots) and \
+                (int(self.msg_split[2]), int(self.msg_split[3])) == self.shared_stats.identity():
+            self.shm_slot = int(self.msg_split[1])
+            server_log.info(str(self.client_id) + ': Client attached to shared stats table in slot {}'.format(
+                self.shm_slot))
+            self.push(client_api["shm_attach_ack"] + client_api["delimiter"] + str(self.shm_slot) +
+                client_api["terminator"])
+            return True
+        else:
+            server_log.info(str(self.client_id) + ': Invalid shared stats table attach request received')
+            self.push(client_api["shm_attach_nack"] + client_api["terminator"])
+            return False
+
+    def handle_rtt_stats(self):
+        if len(self.msg_split) in (6, 7):
+            self.rtt_count = int(self.msg_split[1])
+            self.rtt_p50, self.rtt_p95, self.rtt_p99, self.rtt_max = [float(x) for x in self.msg_split[2:6]]
+            self.track_client_time(6)
+            server_log.info(str(self.client_id) + ': Heartbeat RTT stats received. p50: {:.2f} ms p99: {:.2f} ms'
+                .format(self.rtt_p50 * 1000, self.rtt_p99 * 1000))
+            return True
+        else:
+            server_log.info(str(self.client_id) + ': Invalid heartbeat RTT stats received')
+            return False
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capture', dest='capture_file', default=None,
+                        help='record all inbound client messages to this file for later replay')
+    parser.add_argument('--save-baseline', dest='save_baseline', default=None, metavar='NAME',
+                        help='save this run as a baseline for later runs to be compared against')
+    parser.add_argument('--compare-baseline', dest='compare_baseline', default=None, metavar='NAME',
+                        help='compare this run against a saved baseline and exit with status 1 on any regression, '
+                             'or 2 if the run did not finish or nothing could be compared')
+    args = parser.parse_args()
+
+    # Load the baseline up front so a missing or invalid one is reported before any clients run
+    baseline = None
+    if args.compare_baseline:
+        try:
+            baseline = load_baseline(args.compare_baseline)
+        except (IOError, ValueError) as e:
+            parser.error('could not load baseline "{}": {}'.format(args.compare_baseline, e))
+
     server = None
+    finished = False
+    # A comparison that never happens must not pass the performance gate
+    status = GATE_NO_VERDICT if args.compare_baseline else 0
     try:
-        server = Server(config["host"], config["port"])
+        server = Server(config["host"], config["port"], args.capture_file)
         server.start_server()
+        finished = True
     except KeyboardInterrupt:
         server_log.info('Keyboard interrupt: Shutting server down...')
     except Exception as e:
@@ -263,5 +521,16 @@ if __name__ == '__main__':
        raise e
     finally:
         if server:
-            server.write_report()
-            server.close()
+            try:
+                server.write_report()
+                # Only a run that finished normally is compared against or saved as a baseline
+                if finished:
+                    if args.compare_baseline:
+                        status = server.compare_baseline(args.compare_baseline, baseline)
+                    if args.save_baseline:
+                        server.save_baseline(args.save_baseline)
+                elif args.compare_baseline or args.save_baseline:
+                    server_log.info('Run did not finish: baseline not compared or saved')
+            finally:
+                server.close()
+    sys.exit(status)
@@ -0,0 +1,106 @@
+__author__ = 'Wade Pentz'
+
+import os
+import mmap
+import struct
+from config import config
+
+"""shm_transport.py
+
+SharedStatsTable is an optional transport for telemetry between the server and clients
+running on the same host. The server creates a memory-mapped file holding one slot per
+client id. Each slot is split into channels (performance stats, file rollover) and every
+channel is written by exactly one client process. A client publishes into its
+channels with plain memory writes and the server polls all attached slots in bulk from its
+main loop, so high-frequency telemetry costs no syscalls and no socket traffic. Control
+messages (ready, start, done, etc.) and heartbeats, which are echoed back to measure
+round-trip time, still travel over the client's TCP connection.
+
+Each channel is guarded by a sequence lock: the writer makes the sequence number odd
+before updating the values and even again afterwards, and a reader retries whenever it
+sees an odd sequence number or the number changes while it is reading. Channel values
+are cumulative so the server never needs to see every individual update.
+"""
+
+# Channels within a client's slot. Values published to each channel:
+#   perf stats:    (count, CPU total, MEM total, 0)
+#   file rollover: (count, write time total, 0, 0)
+CHANNEL_PERF_STATS = 0
+CHANNEL_FILE_ROLLOVER = 1
+NUM_CHANNELS = 2
+
+SEQ = struct.Struct('=I4x')
+SEQ_MASK = 0xFFFFFFFF
+VALUES = struct.Struct('=4d')
+CHANNEL_SIZE = SEQ.size + VALUES.size
+SLOT_SIZE = CHANNEL_SIZE * NUM_CHANNELS
+SEQLOCK_RETRIES = 100
+
+
+class SharedStatsTable(object):
+    """Table of seqlock'd telemetry slots in a memory-mapped file shared by the server and co-located clients.
+
+    Args:
+        path (str): path of the shared memory file (ideally on a tmpfs such as /dev/shm).
+        num_slots (int): number of client slots in the table.
+        create (bool): True to create (or reset) the file, False to attach to an existing one.
+    """
+
+    def __init__(self, path, num_slots, create=False):
+        self.path = path
+        self.num_slots = num_slots
+        size = SLOT_SIZE * num_slots
+        if create:
+            with open(path, 'wb') as f:
+                f.truncate(size)
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def identity(self):
+        """Returns the (device, inode) of the shared memory file. Two processes share the table only if both match."""
+        stat = os.fstat(self.file.fileno())
+        return stat.st_dev, stat.st_ino
+
+    def offset(self, slot, channel):
+        return slot * SLOT_SIZE + channel * CHANNEL_SIZE
+
+    def publish(self, slot, channel, values):
+        """Writer side: Replaces the values of a channel. Only one process may publish to a given channel."""
+        offset = self.offset(slot, channel)
+        seq = SEQ.unpack_from(self.map, offset)[0]
+        SEQ.pack_into(self.map, offset, (seq + 1) & SEQ_MASK)
+        VALUES.pack_into(self.map, offset + SEQ.size, *values)
+        SEQ.pack_into(self.map, offset, (seq + 2) & SEQ_MASK)
+
+    def accumulate(self, slot, channel, deltas):
+        """Writer side: Adds deltas to the current values of a channel."""
+        values = VALUES.unpack_from(self.map, self.offset(slot, channel) + SEQ.size)
+        self.publish(slot, channel, [value + delta for value, delta in zip(values, deltas)])
+
+    def read(self, slot, channel):
+        """Reader side: Returns (seq, values) for a channel or None if a consistent read was not possible.
+        A seq of 0 means the channel has never been published to."""
+        offset = self.offset(slot, channel)
+        for attempt in range(SEQLOCK_RETRIES):
+            seq = SEQ.unpack_from(self.map, offset)[0]
+            if seq & 1:
+                continue
+            values = VALUES.unpack_from(self.map, offset + SEQ.size)
+            if SEQ.unpack_from(self.map, offset)[0] == seq:
+                return seq, values
+        return None
+
+    def close(self, remove=False):
+        """Unmaps the table. The owner (server) removes the file so that clients cannot attach to a stale table."""
+        self.map.close()
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+
+def slot_for_client(client_id, num_slots):
+    """Returns the table slot for a client id or None if the id falls outside of the table."""
+    slot = int(client_id) - config["first_client_id"]
+    if 0 <= slot < num_slots:
+        return slot
+    return None
@@ -0,0 +1,68 @@
+__author__ = 'Wade Pentz'
+
+import unittest
+import sys
+import logging
+import os
+import shutil
+sys.path.append('..')
+from autotune import Autotuner, Candidate, doubling, steps_around, t_critical
+from config import config
+from logs import client_log
+
+"""test_autotune.py
+
+Unit tests for the Autotuner class.
+
+To run these tests simply run this script using Python 2.7 in the command line.
+    ex: python test_autotune.py
+"""
+
+class AutotuneUnitTests(unittest.TestCase):
+    """Contains all unit tests for the Autotuner class."""
+
+    @classmethod
+    def setUpClass(cls):
+        client_log.setLevel(logging.ERROR)
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.isdir(config["client_file_path"]):
+            shutil.rmtree(config["client_file_path"])
+
+    def test_grid_sizes(self):
+        self.assertEqual(doubling(10, 80), [10, 20, 40, 80])
+        self.assertEqual(steps_around(20), [14, 20, 28])
+
+    def test_confidence_interval(self):
+        candidate = Candidate('append', 10, 50)
+        candidate.throughputs = [100.0]
+        self.assertEqual(candidate.interval(), (float('-inf'), float('inf')))
+        candidate.throughputs = [100.0, 100.0, 100.0]
+        self.assertEqual(candidate.interval(), (100.0, 100.0))
+        candidate.throughputs = [1.0, 3.0]
+        low, high = candidate.interval()
+        self.assertAlmostEqual(low, 2.0 - 12.706)
+        self.assertAlmostEqual(high, 2.0 + 12.706)
+        self.assertEqual(t_critical(2), 4.303)
+        self.assertEqual(t_critical(100), 1.96)
+
+    def test_chunk_size_too_small(self):
+        with self.assertRaises(ValueError):
+            Autotuner(config["chunk_size_minimum"] - 1, 10, 20)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            Autotuner(10, 10, 20, engines=['mmap'])
+
+    def test_tune(self):
+        tuner = Autotuner(10, 10, 20, engines=['append', 'ring'], min_trials=2, max_trials=3)
+        best = tuner.tune()
+        self.assertEqual(best.chunk_size, 10)
+        self.assertTrue(best.file_size in (10, 14, 20))
+        self.assertTrue(best.mean() > 0)
+        self.assertFalse([name for name in os.listdir(config["client_file_path"]) if name.startswith('autotune_')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,10 +5,14 @@ import sys
 import logging
 import os
 import shutil
+import socket
 sys.path.append('..')
-from client import Client, FileWriterClient
+from client import Client, FileWriterClient, preallocate_file, write_at, _posix_fallocate
+from shm_transport import SharedStatsTable
 from config import config
+from client_api import client_api
 from logs import client_log
+from timing import monotonic, percentile
 
 """test_client.py
 
@@ -56,9 +60,138 @@ class ClientUnitTests(unittest.TestCase):
 
     def test_file_rollover_check(self):
         file_size = 1000
+        client = FileWriterClient(config["host"], config["port"], run_time=self.default_run_time,
+            chunk_size=self.default_chunk_size, file_size=file_size)
+        self.assertTrue(client.init_file_path())
+        self.assertFalse(client.check_file_rollover())
+
+    def test_invalid_configuration_closes_on_connect(self):
+        handlers = list(client_log.handlers)
+        client = FileWriterClient(config["host"], config["port"], run_time=self.default_run_time,
+            chunk_size=self.default_chunk_size, file_size=100000)
+        client.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        runs = []
+        client.run_tests = lambda: runs.append(True)
+        try:
+            client.handle_connect()
+            self.assertTrue(client.tests_done)
+            self.assertEqual(runs, [])
+        finally:
+            for handler in client_log.handlers[len(handlers):]:
+                client_log.removeHandler(handler)
+                handler.close()
+
+    def test_no_setup_before_connecting(self):
+        for path in (config["client_log_path"], config["client_file_path"]):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+        handlers = list(client_log.handlers)
+        client = FileWriterClient(config["host"], config["port"], run_time=self.default_run_time,
+            chunk_size=self.default_chunk_size, file_size=self.default_file_size)
+        self.assertFalse(os.path.exists(config["client_log_path"]))
+        self.assertFalse(os.path.exists(config["client_file_path"]))
+        self.assertEqual(client_log.handlers, handlers)
+        self.assertEqual(client.chunk, None)
+
+    def test_heartbeat_ack_records_rtt(self):
+        client = Client(config["host"], config["port"])
+        client.msg_split = ['hb_ack', repr(monotonic() - 0.5)]
+        client.handle_heartbeat_ack()
+        self.assertEqual(len(client.rtt_samples), 1)
+        self.assertTrue(client.rtt_samples[0] >= 0.5)
+
+    def test_message_received_while_handler_runs(self):
+        client = Client(config["host"], config["port"])
+
+        def run_tests():
+            # A heartbeat ack read by the test loop while the run_tests message is still being handled
+            client.collect_incoming_data('hb_ack:' + repr(monotonic()))
+            client.found_terminator()
+        client.run_tests = run_tests
+        client.collect_incoming_data('run_tests')
+        client.found_terminator()
+        self.assertEqual(len(client.rtt_samples), 1)
+        self.assertEqual(client.msg_buffer, [])
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), 0)
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 50), 3)
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 100), 5)
+
+    def test_negative_ring_size(self):
         with self.assertRaises(ValueError):
             client = FileWriterClient(config["host"], config["port"], run_time=self.default_run_time, 
-                chunk_size=self.default_chunk_size, file_size=file_size)
+                chunk_size=self.default_chunk_size, file_size=self.default_file_size, ring_size=-1)
+
+    def test_preallocate_and_overwrite_in_place(self):
+        if not os.path.isdir(config["client_file_path"]):
+            os.makedirs(config["client_file_path"])
+        file_name = config["client_file_path"] + 'ring_test_file'
+        fd = os.open(file_name, os.O_RDWR | os.O_CREAT)
+        try:
+            preallocate_file(fd, 4096)
+            self.assertEqual(os.fstat(fd).st_size, 4096)
+            self.assertEqual(write_at(fd, b'\x5a' * 10, 100), 10)
+            self.assertEqual(os.fstat(fd).st_size, 4096)
+        finally:
+            os.close(fd)
+        with open(file_name, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[100:110], b'\x5a' * 10)
+        self.assertEqual(data[:100], b'\x00' * 100)
+
+    def test_ring_replaces_leftover_files(self):
+        client = FileWriterClient(config["host"], config["port"], run_time=self.default_run_time,
+            chunk_size=self.default_chunk_size, file_size=self.default_chunk_size, ring_size=1)
+        client.client_id = '100'
+        self.assertTrue(client.init_file_path())
+        with open(client.ring_file_name(0), 'wb') as f:
+            f.truncate(3 * self.default_chunk_size * 1024 * 1024)
+        self.assertTrue(client.allocate_ring())
+        self.assertEqual(os.path.getsize(client.ring_file_name(0)), self.default_chunk_size * 1024 * 1024)
+        client.close_ring()
+        self.assertFalse(os.path.exists(client.ring_file_name(0)))
+
+    def held_test_run(self, reply):
+        """Holds a test request while a shared stats table attach is pending, then replies to the attach.
+        Returns the client and the shared stats table it ran its tests with."""
+        client = FileWriterClient(config["host"], config["port"], run_time=self.default_run_time,
+            chunk_size=self.default_chunk_size, file_size=self.default_file_size)
+        client.init_file_path()
+        runs = []
+        client.run_tests = lambda: runs.append(client.shared_stats)
+        client.pending_shared_stats = SharedStatsTable(config["client_file_path"] + 'test_shm', 4, create=True)
+        client.pending_shm_slot = 3
+        client.handle_run_tests()
+        self.assertEqual(runs, [])
+        client.msg_split = reply
+        client.msg_handler[reply[0]]()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(client.pending_shared_stats, None)
+        return client, runs[0]
+
+    def test_shm_attach_acknowledged(self):
+        client, shared_stats = self.held_test_run([client_api["shm_attach_ack"], '3'])
+        self.assertNotEqual(shared_stats, None)
+        self.assertEqual(client.shm_slot, 3)
+        shared_stats.close()
+
+    def test_shm_attach_rejected(self):
+        client, shared_stats = self.held_test_run([client_api["shm_attach_nack"]])
+        self.assertEqual(shared_stats, None)
+        self.assertEqual(client.shm_slot, None)
+
+    def test_native_preallocation(self):
+        if sys.platform.startswith('linux'):
+            self.assertTrue(hasattr(os, 'posix_fallocate') or _posix_fallocate is not None)
+        if not os.path.isdir(config["client_file_path"]):
+            os.makedirs(config["client_file_path"])
+        fd = os.open(config["client_file_path"] + 'fallocate_test_file', os.O_RDWR | os.O_CREAT)
+        try:
+            preallocate_file(fd, 1024 * 1024)
+            self.assertEqual(os.fstat(fd).st_size, 1024 * 1024)
+        finally:
+            os.close(fd)
 
 
 if __name__ == '__main__':
@@ -6,10 +6,19 @@ import logging
 import os
 import shutil
 import socket
+import json
+import asyncore
+import subprocess
 sys.path.append('..')
 from server import Server, ClientHandler
+from capture import MessageCapture, read_capture
+from client_table import ClientTable, ClientRecord
+from report import FleetReport
+from baseline import build_baseline, compare, load_baseline, baseline_file, GATE_REGRESSION, GATE_NO_VERDICT
+from shm_transport import SharedStatsTable, CHANNEL_PERF_STATS, CHANNEL_FILE_ROLLOVER
 from config import config
 from logs import server_log
+from timing import monotonic
 
 """test_server.py
 
@@ -19,6 +28,18 @@ To run these tests simply run this script using Python 2.7 in the command line.
     ex: python test_server.py
 """
 
+class QueuedClient(object):
+    """Stand-in for a ClientHandler that records when it is sent its test request."""
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.ready_time = 0
+        self.started = False
+
+    def send_run_tests(self):
+        self.started = True
+
+
 class ServerUnitTests(unittest.TestCase):
     """Contains all unit tests for Server and ClientHandler classes."""
 
@@ -30,6 +51,17 @@ class ServerUnitTests(unittest.TestCase):
     def tearDownClass(cls):
         if os.path.isdir(config["server_log_path"]):
             shutil.rmtree(config["server_log_path"])
+        if os.path.isdir(config["baseline_path"]):
+            shutil.rmtree(config["baseline_path"])
+
+    def add_passed_clients(self, table, write_times, chunk_size=10):
+        for write_time_total in write_times:
+            client = ClientRecord(table, table.add_row())
+            client.status = 'PASS'
+            client.chunk_size = chunk_size
+            client.file_size = 50
+            client.files_written = 2
+            client.write_time_total = write_time_total
 
     def setUp(self):
         self.server = Server(config["host"], config["port"])
@@ -53,6 +85,127 @@ class ServerUnitTests(unittest.TestCase):
         self.client_handler.close()
         self.assertTrue(self.server.clients_done())
 
+    def test_admission_limit(self):
+        max_running_clients = config["max_running_clients"]
+        config["max_running_clients"] = 1
+        try:
+            first, second = QueuedClient(100), QueuedClient(101)
+            self.server.request_start(first)
+            self.server.request_start(second)
+            self.assertTrue(first.started)
+            self.assertFalse(second.started)
+            self.server.release(first)
+            self.assertTrue(second.started)
+        finally:
+            config["max_running_clients"] = max_running_clients
+
+    def test_client_table_grows(self):
+        table = ClientTable(2)
+        slots = [table.add_row() for i in range(5)]
+        self.assertEqual(slots, [0, 1, 2, 3, 4])
+        self.assertEqual(table.size, 5)
+        self.assertTrue(table.capacity >= 5)
+
+    def test_fleet_report(self):
+        table = ClientTable()
+        self.assertEqual(FleetReport(table).percentiles('write_rate'), None)
+        for client_id, write_time_total, status in [(100, 1.0, 'PASS'), (101, 1.1, 'PASS'), (102, 0.9, 'PASS'),
+                                                    (103, 1.0, 'PASS'), (104, 10.0, 'ABORTED'), (105, 0, 'NOT STARTED')]:
+            client = ClientRecord(table, table.add_row())
+            client.client_id = client_id
+            client.status = status
+            if status != 'NOT STARTED':
+                client.start_time = 1.0
+            client.files_written = 2
+            client.file_size = 50
+            client.write_time_total = write_time_total
+        report = FleetReport(table)
+        percentiles = report.percentiles('write_rate')
+        self.assertEqual(percentiles[0], 10.0)
+        self.assertEqual(percentiles[50], 100.0)
+        self.assertEqual(report.outliers(), [104])
+        # A client that aborts before it starts is not a sample of a running client
+        client = ClientRecord(table, table.add_row())
+        client.client_id = 106
+        client.status = 'ABORTED'
+        self.assertEqual(report.percentiles('write_rate')[0], 10.0)
+        self.assertEqual(report.outliers(), [104])
+        summary = report.export(config["server_log_path"], 'test_report', end_time='now')
+        self.assertEqual(summary["status_counts"]["PASS"], 4)
+        with open(config["server_log_path"] + 'test_report.json') as f:
+            self.assertEqual(json.load(f)["end_time"], 'now')
+        with open(config["server_log_path"] + 'test_report.csv') as f:
+            self.assertEqual(len(f.readlines()), 8)
+
+    def test_time_ran_without_start(self):
+        self.client_handler.handle_close()
+        self.assertEqual(self.client_handler.status, 'ABORTED')
+        self.assertEqual(self.client_handler.time_ran, 0)
+        self.client_handler = None
+
+    def test_build_baseline(self):
+        table = ClientTable()
+        self.add_passed_clients(table, [1.0, 2.0])
+        self.add_passed_clients(table, [1.0], chunk_size=20)
+        ClientRecord(table, table.add_row()).status = 'ABORTED'
+        baseline = build_baseline(table)
+        self.assertEqual(sorted(baseline), ['chunk_size=10:file_size=50:ring_size=0',
+                                            'chunk_size=20:file_size=50:ring_size=0'])
+        self.assertEqual(baseline['chunk_size=10:file_size=50:ring_size=0']['write_rate'], [100.0, 50.0])
+
+    def test_baseline_comparison(self):
+        self.add_passed_clients(self.server.client_table, [1.0, 1.02, 0.98, 1.01, 0.99])
+        self.server.save_baseline('test_baseline')
+        self.assertEqual(self.server.compare_baseline('test_baseline', load_baseline('test_baseline')), 0)
+        slower = ClientTable()
+        self.add_passed_clients(slower, [2.0, 2.04, 1.96, 2.02, 1.98])
+        verdicts = dict((comparison.metric + str(comparison.pct), comparison.verdict)
+                        for comparison in compare(build_baseline(self.server.client_table), build_baseline(slower)))
+        self.assertEqual(verdicts['write_rate50'], 'REGRESSION')
+        self.assertEqual(verdicts['file_write_time95'], 'REGRESSION')
+        self.assertEqual(verdicts['rtt_p9950'], 'INSUFFICIENT DATA')
+        self.assertEqual(compare(build_baseline(slower), build_baseline(self.server.client_table))[0].verdict,
+                         'IMPROVEMENT')
+        self.server.client_table = slower
+        self.assertEqual(self.server.compare_baseline('test_baseline', load_baseline('test_baseline')),
+                         GATE_REGRESSION)
+
+    def test_baseline_nothing_compared(self):
+        self.add_passed_clients(self.server.client_table, [1.0, 1.02, 0.98, 1.01, 0.99])
+        self.server.save_baseline('test_baseline')
+        baseline = load_baseline('test_baseline')
+        self.server.client_table = ClientTable()
+        ClientRecord(self.server.client_table, self.server.client_table.add_row()).status = 'ABORTED'
+        self.assertEqual(self.server.compare_baseline('test_baseline', baseline), GATE_NO_VERDICT)
+        self.add_passed_clients(self.server.client_table, [1.0, 1.02, 0.98, 1.01, 0.99], chunk_size=20)
+        self.assertEqual(self.server.compare_baseline('test_baseline', baseline), GATE_NO_VERDICT)
+
+    def test_load_invalid_baseline(self):
+        with self.assertRaises(IOError):
+            load_baseline('missing_baseline')
+        self.server.save_baseline('test_invalid_baseline')
+        with open(baseline_file('test_invalid_baseline'), 'w') as f:
+            f.write('{"chunk_size=10:file_size=50:ring_size=0": {}}')
+        with self.assertRaises(ValueError):
+            load_baseline('test_invalid_baseline')
+
+    def test_baseline_too_few_clients(self):
+        table = ClientTable()
+        self.add_passed_clients(table, [1.0, 2.0])
+        self.assertEqual(set(comparison.verdict for comparison in compare(build_baseline(table), build_baseline(table))),
+                         set(['INSUFFICIENT DATA']))
+        self.server.client_table = table
+        self.assertEqual(self.server.compare_baseline('test_baseline', build_baseline(table)), GATE_NO_VERDICT)
+
+    def test_client_record_columns(self):
+        client = ClientRecord(ClientTable(), 0)
+        client.table.add_row()
+        self.assertEqual(client.status, 'NOT STARTED')
+        self.assertEqual(client.client_start_time, None)
+        client.client_start_time = 1.5
+        self.assertEqual(client.client_start_time, 1.5)
+        self.assertEqual(client.write_rate, 0)
+
     def test_bad_file_stats(self):
         self.client_handler.msg_split = ['test']
         self.assertFalse(self.client_handler.handle_file_stats())
@@ -68,6 +221,126 @@ class ServerUnitTests(unittest.TestCase):
     def test_good_perf_stats(self):
         self.client_handler.msg_split = ['test', 0, 0]
         self.assertTrue(self.client_handler.handle_perf_stats())
+
+    def test_bad_file_alloc(self):
+        self.client_handler.msg_split = ['test', 4]
+        self.assertFalse(self.client_handler.handle_file_alloc())
+
+    def test_good_file_alloc(self):
+        self.client_handler.msg_split = ['test', 4, 1.5]
+        self.assertTrue(self.client_handler.handle_file_alloc())
+        self.assertEqual(self.client_handler.ring_size, 4)
+
+    def test_capture_round_trip(self):
+        file_name = config["server_log_path"] + 'test_capture.bin'
+        capture = MessageCapture(file_name)
+        capture.record(100, 'ready')
+        capture.record(101, 'send_stats:1.0:2.0')
+        capture.close()
+        records = list(read_capture(file_name))
+        self.assertEqual([(client_id, msg) for timestamp, client_id, msg in records],
+                         [(100, 'ready'), (101, 'send_stats:1.0:2.0')])
+        self.assertTrue(records[0][0] <= records[1][0])
+
+    def test_replay_sessions_pass(self):
+        file_name = config["server_log_path"] + 'test_replay.bin'
+        capture = MessageCapture(file_name)
+        for msg in ['get_cid', 'ready', 'file_stats:10:50:1.0', 'start:1.0', 'hb:1.5'] + \
+                   ['file_roll:0.5:{}'.format(2.0 + i) for i in range(200)] + \
+                   ['send_stats:1.0:2.0:3.0', 'rtt_stats:1:0.001:0.001:0.001:0.001:4.0', 'done:4.0']:
+            capture.record(100, msg)
+        capture.close()
+        # Replay from another process so the server only reads each session as its packets arrive
+        with open(os.devnull, 'w') as devnull:
+            replay_process = subprocess.Popen([sys.executable, 'replay.py', '-f', os.path.abspath(file_name),
+                                               '-s', '0', '-n', '3'], cwd='..', stdout=devnull, stderr=devnull)
+            deadline = monotonic() + 10
+            while not self.server.clients_done() and monotonic() < deadline:
+                asyncore.loop(timeout=config["server_timeout"], count=1)
+            self.assertEqual(replay_process.wait(), 0)
+        self.assertEqual(self.server.client_table.size, 3)
+        for slot in range(3):
+            client = ClientRecord(self.server.client_table, slot)
+            self.assertEqual(client.status, 'PASS')
+            self.assertEqual(client.files_written, 200)
+
+    def test_no_messages_processed_after_close(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind((config["host"], 0))
+        listener.listen(1)
+        peer = socket.create_connection(listener.getsockname())
+        sock, addr = listener.accept()
+        listener.close()
+        handler = ClientHandler(sock, addr, 100)
+        peer.sendall('start:1.0\ndone:2.0\nstart:3.0\n')
+        handler.handle_read()
+        peer.close()
+        self.assertEqual(handler.status, 'PASS')
+
+    def test_time_ran_uses_client_clock(self):
+        self.client_handler.msg_split = ['start', '10.0']
+        self.client_handler.handle_start()
+        self.client_handler.msg_split = ['done', '12.5']
+        self.client_handler.handle_done()
+        self.assertEqual(self.client_handler.status, 'PASS')
+        self.assertEqual(self.client_handler.time_ran, 2.5)
+
+    def test_bad_rtt_stats(self):
+        self.client_handler.msg_split = ['test', 3, 0.001]
+        self.assertFalse(self.client_handler.handle_rtt_stats())
+
+    def test_good_rtt_stats(self):
+        self.client_handler.msg_split = ['test', '3', '0.001', '0.002', '0.003', '0.004', '1.0']
+        self.assertTrue(self.client_handler.handle_rtt_stats())
+        self.assertEqual(self.client_handler.rtt_count, 3)
+        self.assertEqual(self.client_handler.rtt_max, 0.004)
+
+    def test_shm_attach_without_table(self):
+        self.client_handler.msg_split = ['test', 0, 0, 0]
+        self.assertFalse(self.client_handler.handle_shm_attach())
+
+    def test_shm_attach_other_clients_slot(self):
+        table = SharedStatsTable(config["server_log_path"] + 'test_shm', 4, create=True)
+        try:
+            self.client_handler.shared_stats = table
+            self.client_handler.client_id = config["first_client_id"] + 1
+            self.client_handler.msg_split = ['test', 2] + list(table.identity())
+            self.assertFalse(self.client_handler.handle_shm_attach())
+            self.assertEqual(self.client_handler.shm_slot, None)
+        finally:
+            table.close(remove=True)
+
+    def test_shm_attach_other_table(self):
+        table = SharedStatsTable(config["server_log_path"] + 'test_shm', 4, create=True)
+        stale_table = SharedStatsTable(config["server_log_path"] + 'test_shm_stale', 4, create=True)
+        try:
+            self.client_handler.shared_stats = table
+            self.client_handler.client_id = config["first_client_id"] + 2
+            self.client_handler.msg_split = ['test', 2] + list(stale_table.identity())
+            self.assertFalse(self.client_handler.handle_shm_attach())
+            self.assertEqual(self.client_handler.shm_slot, None)
+        finally:
+            table.close(remove=True)
+            stale_table.close(remove=True)
+
+    def test_read_shared_stats(self):
+        table = SharedStatsTable(config["server_log_path"] + 'test_shm', 4, create=True)
+        try:
+            self.client_handler.shared_stats = table
+            self.client_handler.file_size = 50
+            self.client_handler.client_id = config["first_client_id"] + 2
+            self.client_handler.msg_split = ['test', 2] + list(table.identity())
+            self.assertTrue(self.client_handler.handle_shm_attach())
+            table.accumulate(2, CHANNEL_PERF_STATS, (1, 10.0, 2.0, 0))
+            table.accumulate(2, CHANNEL_PERF_STATS, (1, 20.0, 4.0, 0))
+            table.accumulate(2, CHANNEL_FILE_ROLLOVER, (1, 0.5, 0, 0))
+            self.client_handler.read_shared_stats()
+            self.assertEqual(self.client_handler.num_stat_reports, 2)
+            self.assertEqual(self.client_handler.cpu_avg, 15.0)
+            self.assertEqual(self.client_handler.files_written, 1)
+            self.assertEqual(self.client_handler.write_rate, 100.0)
+        finally:
+            table.close(remove=True)
     
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+__author__ = 'Wade Pentz'
+
+import time
+import ctypes
+from sys import platform
+
+"""timing.py
+
+Timing helpers shared by the server and clients.
+
+monotonic() returns seconds from a clock that never jumps when the wall clock is changed,
+which makes it suitable for measuring durations and for timestamping protocol messages.
+Values are only comparable with other monotonic() values taken on the same host. Python 2
+does not provide time.monotonic so on Linux and macOS the clock is read with
+clock_gettime() through ctypes, falling back to time.time() elsewhere. clock_gettime() is
+looked up in the symbols already loaded into the process before searching for the C
+library with ctypes.util.find_library(), which runs external tools and would add tens of
+milliseconds to the startup of every client.
+
+percentile() returns nearest-rank percentiles of a list of samples.
+"""
+
+try:
+    from time import monotonic
+except ImportError:
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 6 if platform == "darwin" else 1
+
+    def load_clock_gettime():
+        """Returns the C library's clock_gettime() function, or None if it cannot be found."""
+        try:
+            return ctypes.CDLL(None, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            pass
+        from ctypes.util import find_library
+        try:
+            return ctypes.CDLL(find_library('c'), use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            return None
+
+    _clock_gettime = load_clock_gettime()
+    if _clock_gettime is not None:
+        _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    def monotonic():
+        """Returns the value (in seconds) of a monotonic clock."""
+        if _clock_gettime is None:
+            return time.time()
+        ts = timespec()
+        if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            return time.time()
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+
+def percentile(samples, pct):
+    """Returns the nearest-rank pct percentile (0-100) of samples, or 0 if there are no samples."""
+    if not samples:
+        return 0
+    ordered = sorted(samples)
+    rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]